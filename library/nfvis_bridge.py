@@ -72,21 +72,15 @@ message:
 import os
 from ansible.module_utils.basic import AnsibleModule, json, env_fallback
 from ansible.module_utils._text import to_native
-from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec
+from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec, nfvis_diff, nfvis_changed_fields
+from ansible.module_utils.nfvis import nfvis_bridge_spec, nfvis_bridge_payload, nfvis_bridge_desired, NFVIS_BRIDGE_MERGE_KEYS
 
 def main():
     # define the available arguments/parameters that a user can pass to
     # the module
 
     argument_spec = nfvis_argument_spec()
-    argument_spec.update(state=dict(type='str', choices=['absent', 'present'], default='present'),
-                         name=dict(type='str', aliases=['bridge']),
-                         ports=dict(type='list'),
-                         ip=dict(type='list'),
-                         vlan=dict(type='int'),
-                         purge=dict(type='bool', default=False),
-                         dhcp=dict(type='bool')
-                         )
+    argument_spec.update(nfvis_bridge_spec())
 
     # seed the result dict in the object
     # we primarily care about changed and state
@@ -129,34 +123,11 @@ def main():
     if nfvis.params['state'] == 'present':
 
         if nfvis.params['name'] not in bridge_dict or nfvis.params['purge'] == True:
-            # If the
             # Construct the payload
-            payload = {'bridge': {}}
-            payload['bridge']['name'] = nfvis.params['name']
-
-            if nfvis.params['dhcp'] == True:
-                payload['bridge']['dhcp'] = [ None ]
-
-            payload['bridge']['port'] = []
-            if nfvis.params['ports']:
-                for port in nfvis.params['ports']:
-                    payload['bridge']['port'].append( {'name': port} )
-
-            payload['bridge'].pop('vlan', None)
-            if nfvis.params['vlan']:
-                payload['bridge']['vlan'] = nfvis.params['vlan']
-
-            if nfvis.params['ip']:
-                payload['bridge']['ip'] = {}
-                if 'address' in nfvis.params['ip']:
-                    payload['bridge']['ip']['address'] = nfvis.params['ip']['address']
-                else:
-                    module.fail_json(msg="address must be specified for ip")
-                if 'netmask' in nfvis.params['ip']:
-                    payload['bridge']['ip']['netmask'] = nfvis.params['ip']['netmask']
-                else:
-                    module.fail_json(msg="netmask must be specified for ip")
-
+            try:
+                payload = nfvis_bridge_payload(nfvis.params)
+            except ValueError as e:
+                module.fail_json(msg=to_native(e))
 
             if nfvis.params['name'] in bridge_dict:
                 # We are overwritting (purging) what is on the NFVIS host
@@ -170,65 +141,21 @@ def main():
 
             nfvis.result['changed'] = True
         else:
-            # The bridge exists on the device, so let's start with the original payload and see if anything changed
-            payload = {'bridge': bridge_dict[nfvis.params['name']]}
-
-            if nfvis.params['ports']:
-                # Check ports
-                if 'port' not in payload['bridge']:
-                    payload['bridge']['port'] = []
-                    # No ports are on the NFVIS host, so add them all
-                    for port in nfvis.params['ports']:
-                        payload['bridge']['port'].append({'name': port})
-                        nfvis.result['what_changed'].append('port')
-                else:
-                    # Add the ports that are not already on the NFVIS host
-                    existing_ports = []
-                    for item in payload['bridge']['port']:
-                        existing_ports.append(item['name'])
-                    for port in nfvis.params['ports']:
-                        if port not in existing_ports:
-                            payload['bridge']['port'].append({'name': port})
-                            nfvis.result['what_changed'].append('port')
-
-            if nfvis.params['vlan']:
-                if 'vlan' not in payload['bridge'] or nfvis.params['vlan'] != payload['bridge']['vlan']:
-                    payload['bridge']['vlan'] = nfvis.params['vlan']
-                    nfvis.result['what_changed'].append('vlan')
-
-            if nfvis.params['dhcp']:
-                if nfvis.params['dhcp'] == True and 'dhcp' not in payload['bridge']:
-                    payload['bridge']['dhcp'] = [ nfvis.params['dhcp'] ]
-                    nfvis.result['what_changed'].append('dhcp')
-                elif nfvis.params['dhcp'] == False and 'dhcp' in payload['bridge']:
-                    payload['bridge']['dhcp'] = None
-                    nfvis.result['what_changed'].append('dhcp')
-
-            if nfvis.params['ip']:
-                if 'ip' not in payload['bridge']:
-                    # No ip on the NFVIS host, so add the entire dict
-                    payload['bridge']['ip'] = nfvis.params['ip']
-                    nfvis.result['what_changed'].append('ip')
-                else:
-                    if 'address' in nfvis.params['ip']:
-                        if payload['bridge']['ip']['address'] != nfvis.params['ip']['address']:
-                            payload['bridge']['ip']['address'] = nfvis.params['ip']['address']
-                            nfvis.result['what_changed'].append('ip')
-                    else:
-                        module.fail_json(msg="address must be specified for ip")
-
-                    if 'netmask' in nfvis.params['ip']:
-                        if payload['bridge']['ip']['netmask'] != nfvis.params['ip']['netmask']:
-                            payload['bridge']['ip']['netmask'] = nfvis.params['ip']['netmask']
-                            nfvis.result['what_changed'].append('ip')
-                    else:
-                        module.fail_json(msg="netmask must be specified for ip")
-
-            if nfvis.result['what_changed']:
+            # The bridge exists on the device, so compare it against the desired state
+            try:
+                desired = nfvis_bridge_desired(nfvis.params)
+            except ValueError as e:
+                module.fail_json(msg=to_native(e))
+
+            # Ports are only ever added to the ones already on the NFVIS host
+            changes = nfvis_diff(desired, {'bridge': bridge_dict[nfvis.params['name']]},
+                                 merge_keys=NFVIS_BRIDGE_MERGE_KEYS)
+            nfvis.result['what_changed'] = nfvis_changed_fields(changes)
+
+            if changes:
                 url_path = '/config/bridges/bridge/{0}'.format(nfvis.params['name'])
                 nfvis.result['changed'] = True
-                if not module.check_mode:
-                    response = nfvis.request(url_path, method='PUT', payload=json.dumps(payload))
+                nfvis.update(url_path, {'bridge': bridge_dict[nfvis.params['name']]}, changes)
 
     else:
         if nfvis.params['name'] in bridge_dict:
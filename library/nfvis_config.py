@@ -0,0 +1,456 @@
+#!/usr/bin/python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: nfvis_config
+
+short_description: Converges the whole configuration of an NFVIS host
+
+version_added: "n/a"
+
+description:
+    - "Takes the desired system settings, bridges, networks and deployments of an NFVIS host, reads the host's configuration once, plans the changes in dependency order and applies them"
+    - "With state absent, deletes every deployment, then every network and bridge that NFVIS did not create itself, then every image"
+    - "The plan is returned, and only the plan is made in check mode"
+
+options:
+    state:
+        description:
+            - 'present' to converge the host to the given configuration, or 'absent' to tear the whole host down (Default: 'present')
+        required: false
+    keep:
+        description:
+            - The deployments, networks, bridges and images that state 'absent' leaves in place, with the objects they use
+        required: false
+    wait_timeout:
+        description:
+            - How long state 'absent' waits for the deleted deployments to be gone, in seconds (Default: 300)
+        required: false
+    system:
+        description:
+            - The system settings, with the options of nfvis_system
+        required: false
+    bridges:
+        description:
+            - The bridges, each with the options of nfvis_bridge
+        required: false
+    networks:
+        description:
+            - The networks, each with the options of nfvis_network
+        required: false
+    deployments:
+        description:
+            - The deployments, each with the options of nfvis_deployment
+        required: false
+
+author:
+    - Steven Carter
+'''
+
+EXAMPLES = '''
+- nfvis_config:
+    host: 1.2.3.4
+    user: admin
+    password: cisco
+    system:
+      hostname: nfvis1
+      mgmt: dhcp
+    bridges:
+      - name: lan-br
+        ports:
+          - GE0-1
+    networks:
+      - name: lan-net
+        bridge: lan-br
+    deployments:
+      - name: isrv1
+        image: isrv
+        flavor: isrv-small
+        interfaces:
+          - network: int-mgmt-net
+          - network: lan-net
+
+# Delete everything but the defaults and the vBond deployment
+- nfvis_config:
+    host: 1.2.3.4
+    user: admin
+    password: cisco
+    state: absent
+    keep:
+      - vbond
+'''
+
+RETURN = '''
+plan:
+    description: The steps taken, each with the kind and name of the object, the action, the settings that changed, the requests sent, the indexes of the steps it waited for (after) and the seconds it took
+    type: list
+timings:
+    description: The seconds spent reading the configuration (snapshot), planning (plan) and applying the plan (apply)
+    type: dict
+'''
+
+import time
+from ansible.module_utils.basic import AnsibleModule, json, env_fallback
+from ansible.module_utils._text import to_native
+from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec, nfvis_as_list, nfvis_facts_section, nfvis_diff, nfvis_changed_fields
+from ansible.module_utils.nfvis import nfvis_update_requests, nfvis_step_dependencies, NFVIS_TENANT_DEPLOYMENTS_PATH
+from ansible.module_utils.nfvis import nfvis_deployment_images, nfvis_deployment_networks, nfvis_image_delete_requests
+from ansible.module_utils.nfvis import NFVIS_TENANT_OPDATA_PATH, NFVIS_DEFAULT_BRIDGES, NFVIS_DEFAULT_NETWORKS
+from ansible.module_utils.nfvis import nfvis_system_spec, nfvis_system_desired, nfvis_bridge_spec, nfvis_bridge_payload, nfvis_bridge_desired
+from ansible.module_utils.nfvis import nfvis_network_spec, nfvis_network_desired, nfvis_network_payload, NFVIS_BRIDGE_MERGE_KEYS
+from ansible.module_utils.nfvis import nfvis_deployment_spec, nfvis_deployment_payload, nfvis_deployment_drift, nfvis_deployment_update_requests
+from ansible.module_utils.nfvis import NFVIS_DEPLOYMENT_MUTABLE_KEYS
+
+# The configuration read in the snapshot, by name: the path and the key of the response
+SNAPSHOT_PATHS = {
+    'settings': ('/config/system/settings', 'system:settings'),
+    'bridges': ('/config/bridges?deep', 'network:bridges'),
+    'networks': ('/config/networks?deep', 'network:networks'),
+    'images': ('/config/vm_lifecycle/images?deep', 'vmlc:images'),
+}
+
+# The order in which state: absent deletes the objects of the host
+TEARDOWN_TIERS = ['deployment', 'network', 'bridge', 'image']
+
+
+def snapshot(nfvis, tenants):
+    """Read the configuration of the host, with the deployments of the given tenants, in parallel and hash the objects by name."""
+    fetches = [name for name in SNAPSHOT_PATHS if name != 'settings' or nfvis.params['system']]
+
+    def fetch(name):
+        if name in SNAPSHOT_PATHS:
+            path, key = SNAPSHOT_PATHS[name]
+        else:
+            path, key = NFVIS_TENANT_DEPLOYMENTS_PATH.format(name[1]), 'vmlc:deployments'
+        return nfvis_facts_section(nfvis.request(path), key)
+
+    sections, seconds = nfvis.parallel(fetch, fetches + [('tenant', tenant) for tenant in tenants])
+    sections = dict(zip(fetches + tenants, sections))
+
+    def by_name(section, key):
+        items = section.get(key) if isinstance(section, dict) else None
+        return dict((item['name'], item) for item in nfvis_as_list(items) if isinstance(item, dict) and 'name' in item)
+
+    return dict(settings=sections.get('settings'),
+                bridges=by_name(sections['bridges'], 'bridge'),
+                networks=by_name(sections['networks'], 'network'),
+                images=by_name(sections['images'], 'image'),
+                deployments=dict((tenant, by_name(sections[tenant], 'deployment')) for tenant in tenants))
+
+
+def plan(nfvis, current):
+    """The steps that converge the host.
+
+    Deletions are listed first, from deployments down to bridges, then the
+    system settings, bridges, networks and deployments that are created or
+    updated.  The order they run in comes from nfvis_step_dependencies(), so
+    a deleted bridge still waits for the networks that move off it.
+    Raises ValueError when the desired state is invalid or incomplete.
+    """
+    params = nfvis.params
+    bridges = params['bridges'] or []
+    networks = params['networks'] or []
+    deployments = params['deployments'] or []
+    for kind, items in [('bridge', bridges), ('network', networks), ('deployment', deployments)]:
+        for item in items:
+            if not item['name']:
+                raise ValueError('name must be specified for every {0}'.format(kind))
+
+    def deployment_path(item):
+        return '/config/vm_lifecycle/tenants/tenant/{0}/deployments/deployment/{1}'.format(item['tenant'], item['name'])
+
+    steps = []
+
+    # uses are the objects that the object refers to once the step is done,
+    # used those it refers to before, see nfvis_step_dependencies()
+    def step(kind, name, action, requests, what_changed=None, wait_timeout=None, uses=None, tenant=None, used=None):
+        steps.append(dict(kind=kind, name=name, action=action, requests=requests, tenant=tenant,
+                          what_changed=what_changed or [], wait_timeout=wait_timeout, uses=uses or [], used=used or []))
+
+    def deployment_uses(deployment):
+        return ([('network', network) for network in nfvis_deployment_networks(deployment)] +
+                [('image', image) for image in nfvis_deployment_images(deployment)])
+
+    # Tear down what is absent, dependents first.  The networks and images of
+    # a deployment are only free once its VMs are gone, so WAIT for that
+    for item in deployments:
+        if item['state'] == 'absent' and item['name'] in current['deployments'][item['tenant']]:
+            step('deployment', item['name'], 'delete',
+                 [('DELETE', deployment_path(item), None), ('WAIT', NFVIS_TENANT_OPDATA_PATH.format(item['tenant']), None)],
+                 wait_timeout=item['wait_timeout'], uses=deployment_uses(current['deployments'][item['tenant']][item['name']]),
+                 tenant=item['tenant'])
+    for item in networks:
+        if item['state'] == 'absent' and item['name'] in current['networks']:
+            step('network', item['name'], 'delete', [('DELETE', '/config/networks/network/{0}'.format(item['name']), None)],
+                 uses=[('bridge', current['networks'][item['name']].get('bridge'))])
+    for item in bridges:
+        if item['state'] == 'absent' and item['name'] in current['bridges']:
+            step('bridge', item['name'], 'delete', [('DELETE', '/config/bridges/bridge/{0}'.format(item['name']), None)])
+
+    if params['system']:
+        settings = {'settings': current['settings']}
+        changes = nfvis_diff(nfvis_system_desired(params['system']), settings)
+        if changes:
+            step('system', 'settings', 'update', nfvis_update_requests('/config/system/settings', settings, changes)[0],
+                 nfvis_changed_fields(changes))
+
+    # The bridges, networks and images that exist once the deletions are done
+    deleted = set((entry['kind'], entry['name']) for entry in steps if entry['action'] == 'delete')
+    available = dict(bridge=set(name for name in current['bridges'] if ('bridge', name) not in deleted),
+                     network=set(name for name in current['networks'] if ('network', name) not in deleted),
+                     image=set(current['images']))
+
+    for item in bridges:
+        if item['state'] != 'present':
+            continue
+        url_path = '/config/bridges/bridge/{0}'.format(item['name'])
+        if item['name'] not in current['bridges']:
+            step('bridge', item['name'], 'create', [('POST', '/config/bridges', json.dumps(nfvis_bridge_payload(item)))])
+        elif item['purge']:
+            step('bridge', item['name'], 'replace', [('PUT', url_path, json.dumps(nfvis_bridge_payload(item)))])
+        else:
+            bridge = {'bridge': current['bridges'][item['name']]}
+            changes = nfvis_diff(nfvis_bridge_desired(item), bridge, merge_keys=NFVIS_BRIDGE_MERGE_KEYS)
+            if changes:
+                step('bridge', item['name'], 'update', nfvis_update_requests(url_path, bridge, changes)[0],
+                     nfvis_changed_fields(changes))
+        available['bridge'].add(item['name'])
+
+    for item in networks:
+        if item['state'] != 'present':
+            continue
+        if item['name'] not in current['networks']:
+            payload = nfvis_network_payload(item)
+            if item['bridge'] not in available['bridge']:
+                raise ValueError('bridge {0} of network {1} does not exist'.format(item['bridge'], item['name']))
+            step('network', item['name'], 'create', [('POST', '/config/networks', json.dumps(payload))],
+                 uses=[('bridge', item['bridge'])])
+        else:
+            network = {'network': current['networks'][item['name']]}
+            changes = nfvis_diff(nfvis_network_desired(item), network)
+            if changes:
+                step('network', item['name'], 'update',
+                     nfvis_update_requests('/config/networks/network/{0}'.format(item['name']), network, changes)[0],
+                     nfvis_changed_fields(changes), uses=[('bridge', item['bridge'])],
+                     used=[('bridge', current['networks'][item['name']].get('bridge'))])
+        available['network'].add(item['name'])
+
+    for item in deployments:
+        if item['state'] != 'present':
+            continue
+        payload = nfvis_deployment_payload(item)
+        for image in nfvis_deployment_images(payload['deployment']):
+            if image not in available['image']:
+                raise ValueError('image {0} of deployment {1} is not registered'.format(image, item['name']))
+        for interface in nfvis_as_list(payload['deployment']['vm_group'].get('interfaces')):
+            if interface['interface']['network'] not in available['network']:
+                raise ValueError('network {0} of deployment {1} does not exist'.format(interface['interface']['network'], item['name']))
+        existing = current['deployments'][item['tenant']].get(item['name'])
+        collection = '/config/vm_lifecycle/tenants/tenant/{0}/deployments'.format(item['tenant'])
+        if existing is None:
+            step('deployment', item['name'], 'create', [('POST', collection, json.dumps(payload))],
+                 uses=deployment_uses(payload['deployment']))
+            continue
+        fingerprint, current_fingerprint, what_changed = nfvis_deployment_drift(payload, existing)
+        if not what_changed:
+            continue
+        immutable = [key for key in what_changed if key not in NFVIS_DEPLOYMENT_MUTABLE_KEYS]
+        if immutable and not item['allow_recreate']:
+            nfvis.module.warn('Deployment {0} differs from the requested configuration in {1}, which requires allow_recreate'.format(
+                item['name'], ', '.join(immutable)))
+        elif immutable:
+            # WAIT polls the operational state until the VMs of the deployment are gone
+            step('deployment', item['name'], 'recreate',
+                 [('DELETE', deployment_path(item), None), ('WAIT', NFVIS_TENANT_OPDATA_PATH.format(item['tenant']), None),
+                  ('POST', collection, json.dumps(payload))], what_changed, item['wait_timeout'],
+                 uses=deployment_uses(payload['deployment']), tenant=item['tenant'], used=deployment_uses(existing))
+        else:
+            step('deployment', item['name'], 'update',
+                 nfvis_deployment_update_requests(deployment_path(item), payload, existing, what_changed), what_changed,
+                 uses=deployment_uses(payload['deployment']), used=deployment_uses(existing))
+
+    return steps
+
+
+def teardown_plan(nfvis, current):
+    """The steps that delete every deployment, every network and bridge that NFVIS did not create and every image.
+
+    Objects named in keep stay, together with what they use: the networks and
+    images of a kept deployment and the bridge of a kept network.
+    """
+    keep = set(nfvis.params['keep'])
+    kept_networks = set(NFVIS_DEFAULT_NETWORKS) | keep
+    kept_images = set(keep)
+    for tenant, deployments in current['deployments'].items():
+        for name, deployment in deployments.items():
+            if name in keep:
+                kept_networks.update(nfvis_deployment_networks(deployment))
+                kept_images.update(nfvis_deployment_images(deployment))
+    kept_bridges = set(NFVIS_DEFAULT_BRIDGES) | keep
+    kept_bridges.update(network.get('bridge') for name, network in current['networks'].items() if name in kept_networks)
+
+    steps = []
+    for tenant, deployments in sorted(current['deployments'].items()):
+        for name in sorted(deployments):
+            if name not in keep:
+                path = '/config/vm_lifecycle/tenants/tenant/{0}/deployments/deployment/{1}'.format(tenant, name)
+                steps.append(dict(kind='deployment', name=name, tenant=tenant, requests=[('DELETE', path, None)]))
+    for name in sorted(current['networks']):
+        if name not in kept_networks:
+            steps.append(dict(kind='network', name=name, requests=[('DELETE', '/config/networks/network/{0}'.format(name), None)]))
+    for name in sorted(current['bridges']):
+        if name not in kept_bridges:
+            steps.append(dict(kind='bridge', name=name, requests=[('DELETE', '/config/bridges/bridge/{0}'.format(name), None)]))
+    for name in sorted(current['images']):
+        if name not in kept_images:
+            steps.append(dict(kind='image', name=name, requests=nfvis_image_delete_requests(current['images'][name])))
+    for step in steps:
+        step.update(action='delete', what_changed=[], wait_timeout=None, uses=[])
+    return steps
+
+
+def teardown_dependencies(steps):
+    """Every step of a tier waits for all of the steps of the tiers before it, see TEARDOWN_TIERS."""
+    dependencies = []
+    for step in steps:
+        tier = TEARDOWN_TIERS.index(step['kind'])
+        dependencies.append(set(index for index, other in enumerate(steps) if TEARDOWN_TIERS.index(other['kind']) < tier))
+    return dependencies
+
+
+def run_step(nfvis, step):
+    """Send the requests of a step in order."""
+    for method, path, payload in step['requests']:
+        if method == 'WAIT':
+            gone = nfvis.poll(lambda: nfvis.deployments_gone(step['tenant'], [step['name']]), step['wait_timeout'])
+            if not gone:
+                nfvis.fail_json(msg='Timed out waiting for {0} {1} to be deleted'.format(step['kind'], step['name']))
+        else:
+            nfvis.request(path, method=method, payload=payload)
+
+
+def apply(nfvis, steps):
+    """Send the requests of every step, each step as soon as the steps it depends on are done.
+
+    Returns the seconds spent on each step by its index.
+    """
+    results, seconds = nfvis.schedule(lambda step: run_step(nfvis, step), steps, nfvis_step_dependencies(steps))
+    return seconds
+
+
+def teardown(nfvis, steps, timings):
+    """Delete tier by tier, with the steps of a tier in parallel.
+
+    NFVIS keeps tearing the VMs down after a deployment is deleted, and its
+    networks cannot go before that is done, so the deployments tier ends by
+    polling the operational state of every affected tenant with one request
+    per tenant until none of them is listed.  Returns the seconds spent on
+    each step by its index, and adds the seconds spent on each tier to timings.
+    """
+    seconds = dict()
+    for kind in TEARDOWN_TIERS:
+        indexes = [index for index, step in enumerate(steps) if step['kind'] == kind]
+        if not indexes:
+            continue
+        start = time.time()
+        results, tier_seconds = nfvis.parallel(lambda index: run_step(nfvis, steps[index]), indexes)
+        for position, index in enumerate(indexes):
+            seconds[index] = tier_seconds.get(position)
+        timings[kind] = dict(delete=round(time.time() - start, 3))
+
+        if kind == 'deployment':
+            start = time.time()
+            deleted = dict()
+            for index in indexes:
+                deleted.setdefault(steps[index]['tenant'], set()).add(steps[index]['name'])
+
+            if not nfvis.poll(lambda: all(nfvis.deployments_gone(tenant, names) for tenant, names in deleted.items()),
+                              nfvis.params['wait_timeout']):
+                nfvis.fail_json(msg='Timed out waiting for the deployments to be deleted')
+            timings[kind]['wait'] = round(time.time() - start, 3)
+    return seconds
+
+
+def main():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+
+    argument_spec = nfvis_argument_spec()
+    argument_spec.update(state=dict(type='str', choices=['absent', 'present'], default='present'),
+                         keep=dict(type='list', default=[]),
+                         wait_timeout=dict(type='int', default=300),
+                         system=dict(type='dict', options=nfvis_system_spec()),
+                         bridges=dict(type='list', elements='dict', options=nfvis_bridge_spec()),
+                         networks=dict(type='list', elements='dict', options=nfvis_network_spec()),
+                         deployments=dict(type='list', elements='dict', options=nfvis_deployment_spec()),
+                         )
+
+    # seed the result dict in the object
+    # we primarily care about changed and state
+    # change is if this module effectively modified the target
+    # state will include any data that you want your module to pass back
+    # for consumption, for example, in a subsequent task
+    result = dict(
+        changed=False,
+    )
+    # the AnsibleModule object will be our abstraction working with Ansible
+    # this includes instantiation, a couple of common attr would be the
+    # args/params passed to the execution, as well as if the module
+    # supports check mode
+    module = AnsibleModule(argument_spec=argument_spec,
+                           supports_check_mode=True,
+                           )
+    nfvis = nfvisModule(module)
+
+    timings = dict()
+    nfvis.result['timings'] = timings
+
+    # Read the configuration of the host once
+    start = time.time()
+    if nfvis.params['state'] == 'absent':
+        current = snapshot(nfvis, nfvis.tenants())
+    else:
+        current = snapshot(nfvis, sorted(set(item['tenant'] for item in nfvis.params['deployments'] or [])))
+    timings['snapshot'] = round(time.time() - start, 3)
+
+    # Work out every change against that snapshot
+    start = time.time()
+    if nfvis.params['state'] == 'absent':
+        steps = teardown_plan(nfvis, current)
+        dependencies = teardown_dependencies(steps)
+    else:
+        try:
+            steps = plan(nfvis, current)
+        except ValueError as e:
+            nfvis.fail_json(msg=to_native(e))
+        dependencies = nfvis_step_dependencies(steps)
+    timings['plan'] = round(time.time() - start, 3)
+    nfvis.result['plan'] = [dict(kind=step['kind'], name=step['name'], action=step['action'],
+                                 what_changed=step['what_changed'],
+                                 requests=['{0} {1}'.format(method, path) for method, path, payload in step['requests']],
+                                 after=sorted(dependencies[index]))
+                            for index, step in enumerate(steps)]
+    nfvis.result['changed'] = bool(steps)
+
+    if not module.check_mode:
+        start = time.time()
+        if nfvis.params['state'] == 'absent':
+            timings['tiers'] = dict()
+            seconds = teardown(nfvis, steps, timings['tiers'])
+        else:
+            seconds = apply(nfvis, steps)
+        timings['apply'] = round(time.time() - start, 3)
+        for index, step in enumerate(nfvis.result['plan']):
+            step['seconds'] = seconds.get(index)
+
+    nfvis.exit_json(**nfvis.result)
+
+
+if __name__ == '__main__':
+    main()
@@ -50,6 +50,23 @@ options:
         description:
             - A list of dictionaries defining the configuration data to feed to the deployment via cloud-init
         required: false
+    allow_recreate:
+        description:
+            - Delete and redeploy an existing deployment when its image or config_data changed (Default: false)
+        required: false
+    wait_timeout:
+        description:
+            - The time to wait for a deployment to be deleted before it is redeployed, and for it to boot with wait (Default: 300)
+        required: false
+    wait:
+        description:
+            - Wait for a created or redeployed VNF to boot (its VM_ALIVE event) before returning (Default: false)
+            - The notification stream of the host is subscribed to, so the module returns as soon as the event is published. Hosts without the stream are polled with backoff instead
+        required: false
+    event_stream:
+        description:
+            - The notification stream that wait subscribes to (Default: NETCONF)
+        required: false
 
 author:
     - Steven Carter
@@ -70,6 +87,8 @@ EXAMPLES = '''
       - network: wan-net
       - network: lan-net
     bootup_time: 600
+    wait: true
+    wait_timeout: 900
     port_forwarding:
       - proxy_port: 20001
         source_bridge: 'wan-br'
@@ -91,38 +110,50 @@ original_message:
     type: str
 message:
     description: The output message that the sample module generates
+ready:
+    description: Whether the VNF booted within wait_timeout (only with wait)
+    type: bool
+ready_via:
+    description: How the boot was seen, 'stream' (the VM_ALIVE event) or 'poll' (the operational state)
+    type: str
+downtime:
+    description: The seconds from deleting a recreated deployment until it was deployed again, or booted with wait
+    type: float
+ready_time:
+    description: The seconds spent waiting for the VNF to boot
+    type: float
 '''
 
 import os
+import time
 from ansible.module_utils.basic import AnsibleModule, json, env_fallback
 from ansible.module_utils._text import to_native
 from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec
+from ansible.module_utils.nfvis import nfvis_deployment_spec, nfvis_deployment_payload, nfvis_deployment_drift, nfvis_deployment_update_requests
+from ansible.module_utils.nfvis import nfvis_event_matches, nfvis_deployment_alive
+from ansible.module_utils.nfvis import NFVIS_DEPLOYMENT_MUTABLE_KEYS, NFVIS_TENANT_OPDATA_PATH
+
+
+def wait_alive(nfvis):
+    """Wait for the deployment to boot, from its VM_ALIVE event or else its operational state."""
+    opdata_path = '{0}?deep'.format(NFVIS_TENANT_OPDATA_PATH.format(nfvis.params['tenant']))
+    start = time.time()
+    nfvis.result['ready'], nfvis.result['ready_via'] = nfvis.wait_for_event(
+        lambda data: nfvis_event_matches(data, nfvis.params['name']),
+        lambda: nfvis_deployment_alive(nfvis.request(opdata_path, fail=False), nfvis.params['name']),
+        nfvis.params['wait_timeout'], stream=nfvis.params['event_stream'])
+    nfvis.result['ready_time'] = round(time.time() - start, 3)
+    if not nfvis.result['ready']:
+        nfvis.fail_json(msg='Timed out waiting for deployment {0} to boot'.format(nfvis.params['name']))
 
 def main():
     # define the available arguments/parameters that a user can pass to
     # the module
 
     argument_spec = nfvis_argument_spec()
-    argument_spec.update(state=dict(type='str', choices=['absent', 'present'], default='present'),
-                         name=dict(type='str', aliases=['deployment']),
-                         image=dict(type='str'),
-                         flavor=dict(type='str'),
-                         bootup_time=dict(type='int', default=-1),
-                         recovery_wait_time=dict(type='int', default=0),
-                         kpi_data=dict(type='bool', default=False),
-                         scaling=dict(type='bool', default=False),
-                         scaling_min_active=dict(type='int', default=1),
-                         scaling_max_active=dict(type='int', default=1),
-                         placement_type=dict(type='str', default='zone_host'),
-                         placement_enforcement=dict(type='str', default='strict'),
-                         placement_host=dict(type='str', default='datastore1'),
-                         recovery_type=dict(type='str', default='AUTO'),
-                         action_on_recovery=dict(type='str', default='REBOOT_ONLY'),
-                         interfaces=dict(type='list'),
-                         port_forwarding=dict(type='list'),
-                         config_data=dict(type='list'),
-                         tenant=dict(type='str', default='admin'),
-                         )
+    argument_spec.update(nfvis_deployment_spec())
+    argument_spec.update(wait=dict(type='bool', default=False),
+                         event_stream=dict(type='str', default='NETCONF'))
 
     # seed the result dict in the object
     # we primarily care about changed and state
@@ -147,127 +178,73 @@ def main():
 
     # Get the list of existing deployments
     url_path = '/config/vm_lifecycle/tenants/tenant/{0}/deployments?deep'.format(nfvis.params['tenant'])
-    response = nfvis.request(url_path, method='GET')
-    # nfvis.result['current'] = response
-    
-    # Turn the list of dictionaries returned in the call into a dictionary of dictionaries hashed by the deployment name
+
+    # Stream the deployments into a dictionary hashed by the deployment name.  Only the deployment being
+    # managed is kept, the others are just indexed by name so that large responses use bounded memory.
     deployment_dict = {}
-    try:
-        for item in response['vmlc:deployments']['deployment']:
-            name = item['name']
-            deployment_dict[name] = item
-    except TypeError:
-        pass
-    except KeyError:
-        pass
+    for item in nfvis.request_items(url_path, 'vmlc:deployments.deployment'):
+        if isinstance(item, dict) and 'name' in item:
+            deployment_dict[item['name']] = item if item['name'] == nfvis.params['name'] else None
 
     if nfvis.params['state'] == 'present':
+        # Construct the payload
+        try:
+            payload = nfvis_deployment_payload(nfvis.params)
+            # Fingerprint the settings that define the deployment so that drift can be detected cheaply
+            nfvis.result['fingerprint'], current_fingerprint, what_changed = nfvis_deployment_drift(
+                payload, deployment_dict.get(nfvis.params['name']))
+        except ValueError as e:
+            module.fail_json(msg=to_native(e))
+
+        nfvis.result['update_path'] = 'none'
         if nfvis.params['name'] in deployment_dict:
             # The deployment exists on the device, so check to see if it is the same configuration
             nfvis.result['changed'] = False
+            nfvis.result['current_fingerprint'] = current_fingerprint
+            nfvis.result['drift'] = nfvis.result['current_fingerprint'] != nfvis.result['fingerprint']
+            if nfvis.result['drift']:
+                nfvis.result['what_changed'] = what_changed
+                start = time.time()
+                deployment_path = '/config/vm_lifecycle/tenants/tenant/{0}/deployments/deployment/{1}'.format(nfvis.params['tenant'], nfvis.params['name'])
+                immutable = [key for key in nfvis.result['what_changed'] if key not in NFVIS_DEPLOYMENT_MUTABLE_KEYS]
+                if immutable and not nfvis.params['allow_recreate']:
+                    module.warn('Deployment {0} differs from the requested configuration in {1}, which requires allow_recreate'.format(
+                        nfvis.params['name'], ', '.join(immutable)))
+                elif immutable:
+                    # Immutable settings changed, so the deployment has to be deleted and deployed again
+                    nfvis.result['update_path'] = 'recreate'
+                    if not module.check_mode:
+                        down_start = time.time()
+                        nfvis.request(deployment_path, 'DELETE')
+                        gone = nfvis.poll(lambda: nfvis.deployments_gone(nfvis.params['tenant'], [nfvis.params['name']]),
+                                          nfvis.params['wait_timeout'])
+                        if not gone:
+                            nfvis.fail_json(msg='Timed out waiting for deployment {0} to be deleted'.format(nfvis.params['name']))
+                        url_path = '/config/vm_lifecycle/tenants/tenant/{0}/deployments'.format(nfvis.params['tenant'])
+                        response = nfvis.request(url_path, method='POST', payload=json.dumps(payload))
+                        if nfvis.params['wait']:
+                            wait_alive(nfvis)
+                        nfvis.result['downtime'] = round(time.time() - down_start, 3)
+                    nfvis.result['changed'] = True
+                else:
+                    # Only mutable settings changed, so update them through the vm_group sub-resources
+                    nfvis.result['update_path'] = 'in_place'
+                    requests = nfvis_deployment_update_requests(deployment_path, payload, deployment_dict[nfvis.params['name']],
+                                                                nfvis.result['what_changed'])
+                    for method, path, body in requests:
+                        if not module.check_mode:
+                            response = nfvis.request(path, method=method, payload=body)
+                    nfvis.result['changed'] = True
+                nfvis.result['update_time'] = round(time.time() - start, 3)
         else:
             # The deployment does not exist on the device, so add it
-            # Construct the payload
-            payload = {'deployment': {}}
-            payload['deployment']['name'] = nfvis.params['name']
-            payload['deployment']['vm_group'] = {}
-            payload['deployment']['vm_group']['name'] = nfvis.params['name']
-            if nfvis.params['image']:
-                payload['deployment']['vm_group']['image'] = nfvis.params['image']
-            else:
-                module.fail_json(msg="image must be specified when state is present")
-            if nfvis.params['flavor']:
-                payload['deployment']['vm_group']['flavor'] = nfvis.params['flavor']
-            else:
-                module.fail_json(msg="flavor must be specified when state is present")
-            payload['deployment']['vm_group']['bootup_time'] = nfvis.params['bootup_time']
-            payload['deployment']['vm_group']['recovery_wait_time'] = nfvis.params['recovery_wait_time']
-            payload['deployment']['vm_group']['kpi_data'] = {}
-            payload['deployment']['vm_group']['kpi_data']['enabled'] = nfvis.params['kpi_data']
-            payload['deployment']['vm_group']['scaling'] = {}
-            payload['deployment']['vm_group']['scaling']['min_active'] = nfvis.params['scaling_min_active']
-            payload['deployment']['vm_group']['scaling']['max_active'] = nfvis.params['scaling_max_active']
-            payload['deployment']['vm_group']['scaling']['elastic'] = nfvis.params['scaling']
-            payload['deployment']['vm_group']['placement'] = {}
-            payload['deployment']['vm_group']['placement']['type'] = nfvis.params['placement_type']
-            payload['deployment']['vm_group']['placement']['enforcement'] = nfvis.params['placement_enforcement']
-            payload['deployment']['vm_group']['placement']['host'] = nfvis.params['placement_host']
-            payload['deployment']['vm_group']['recovery_policy'] = {}
-            payload['deployment']['vm_group']['recovery_policy']['recovery_type'] = nfvis.params['recovery_type']
-            payload['deployment']['vm_group']['recovery_policy']['action_on_recovery'] = nfvis.params['action_on_recovery']
-
-            port_forwarding = {}
-            if nfvis.params['port_forwarding']:
-               for item in nfvis.params['port_forwarding']:
-                   port_forwarding['port'] = {}
-                   port_forwarding['port']['type'] = item.get('type', 'ssh')
-                   port_forwarding['port']['vnf_port'] = item.get('vnf_port', 22)
-                   port_forwarding['port']['external_port_range'] = {}
-                   if 'proxy_port' in item:
-                       port_forwarding['port']['external_port_range']['start'] = item['proxy_port']
-                       port_forwarding['port']['external_port_range']['end'] = item['proxy_port']
-                   else:
-                       module.fail_json(msg="proxy_port must be specified for port_forwarding")
-                   port_forwarding['port']['protocol'] = item.get('protocol', 'tcp')
-                   port_forwarding['port']['source_bridge'] = item.get('source_bridge', 'MGMT')
-
-            if nfvis.params['interfaces']:
-                payload['deployment']['vm_group']['interfaces'] = []
-                for index, item in enumerate(nfvis.params['interfaces']):
-                    entry = {}
-                    entry['interface'] = {}
-                    entry['interface']['nicid'] = item.get('nicid', index)
-                    if 'network' in item:
-                       entry['interface']['network'] = item['network']
-                    else:
-                        module.fail_json(msg="network must be specified for interface")
-                    if 'model' in item:
-                        entry['interface']['model'] = item['model']
-                    if index == 0 and 'port' in port_forwarding:
-                       entry['interface']['port_forwarding'] = port_forwarding
-                    payload['deployment']['vm_group']['interfaces'].append(entry)
-
-            if nfvis.params['config_data']:
-                payload['deployment']['vm_group']['config_data'] = []
-                for item in nfvis.params['config_data']:
-                    entry = {'configuration': {}}
-                    if 'dst' in item:
-                       entry['configuration']['dst'] = item['dst']
-                    else:
-                       module.fail_json(msg="dst must be specified for config_data")
-                    if 'data' in item:
-                        if isinstance(item['data'], str):
-                            entry['configuration']['data'] = item['data']
-                        else:
-                            entry['configuration']['data'] = json.dumps(item['data'])
-                    else:
-                       module.fail_json(msg="data must be specified for config_data")
-                    payload['deployment']['vm_group']['config_data'].append(entry)
-
-            if nfvis.params['kpi_data'] == True or nfvis.params['bootup_time'] > 0:
-                payload['deployment']['vm_group']['kpi_data']['kpi'] = {}
-                payload['deployment']['vm_group']['kpi_data']['kpi']['event_name'] = 'VM_ALIVE'
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_value'] = 1
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_cond'] = 'GT'
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_type'] = 'UINT32'
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector'] = {}
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['type'] = 'ICMPPing'
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['nicid'] = 0
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['poll_frequency'] = 3
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['polling_unit'] = 'seconds'
-                payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['continuous_alarm'] = False
-                payload['deployment']['vm_group']['rules'] = {}
-                payload['deployment']['vm_group']['rules']['admin_rules'] = {}
-                payload['deployment']['vm_group']['rules']['admin_rules']['rule'] = {}
-                payload['deployment']['vm_group']['rules']['admin_rules']['rule']['event_name'] = 'VM_ALIVE'
-                payload['deployment']['vm_group']['rules']['admin_rules']['rule']['action'] = [ "ALWAYS log", "FALSE recover autohealing", "TRUE servicebooted.sh" ]
-
-
-
+            nfvis.result['update_path'] = 'create'
             nfvis.result['payload'] = payload
             url_path = '/config/vm_lifecycle/tenants/tenant/{0}/deployments'.format(nfvis.params['tenant'])
             if not module.check_mode:
                 response = nfvis.request(url_path, method='POST', payload=json.dumps(payload))
+                if nfvis.params['wait']:
+                    wait_alive(nfvis)
             nfvis.result['changed'] = True
     else:
         if nfvis.params['name'] in deployment_dict:
@@ -8,45 +8,55 @@ ANSIBLE_METADATA = {
 
 DOCUMENTATION = '''
 ---
-module: nfvis_vlan
+module: nfvis_facts
 
-short_description: This is my sample module
+short_description: Gathers facts from an NFVIS host
 
-version_added: "2.4"
+version_added: "n/a"
 
 description:
-    - "Create a VLAN on an NFVIS host"
+    - "Gathers the platform details, CPU allocation, deployments, bridges and networks of an NFVIS host"
 
 options:
-    vlan_id:
+    snapshot_dir:
         description:
-            - The VLAN ID of the VLAN.
-        required: true
-    state:
+            - Directory in which to keep a digest of the facts of every host. When set, only the objects added, removed or modified since the previous run are returned
+        required: false
+    tenants:
+        description:
+            - The tenants whose deployments are returned in tenant_deployments, or in the changes of tenant_deployments with snapshot_dir. By default all of the tenants of the host. The admin deployments are returned in deployments
+        required: false
+    indexes:
         description:
-            - The state of the VLAN (i.e. `present` or `absent`)
+            - Also return name-keyed maps of the deployments, bridges and networks and the indexes between them (Default: false)
         required: false
 
 author:
-    - Your Name (@yourhandle)
+    - Steven Carter
 '''
 
 EXAMPLES = '''
-# Create VLAN 10
-- nfvis_vlan:
+# Gather all facts
+- nfvis_facts:
+    host: 1.2.3.4
+    user: admin
+    password: cisco
+
+# Only the deployments of two tenants, fetched in parallel
+- nfvis_facts:
     host: 1.2.3.4
     user: admin
     password: cisco
-    state: present
-    vlan_id: 100
+    tenants:
+      - admin
+      - branch1
 
-# Delete VLAN 10
-- nfvis_vlan:
+# Only return what changed since the last run
+- nfvis_facts:
     host: 1.2.3.4
     user: admin
     password: cisco
-    state: absent
-    vlan_id: 100
+    snapshot_dir: "{{ playbook_dir }}/.nfvis_snapshots"
 '''
 
 RETURN = '''
@@ -58,17 +68,22 @@ message:
 '''
 
 import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
 from ansible.module_utils.basic import AnsibleModule, json, env_fallback
 from ansible.module_utils._text import to_native
-from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec
+from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec, nfvis_facts_section, nfvis_facts_digest, nfvis_facts_changes, nfvis_facts_index, NFVIS_FACTS_SECTIONS
 
 def main():
     # define the available arguments/parameters that a user can pass to
     # the module
 
     argument_spec = nfvis_argument_spec()
-    # argument_spec.update(state=dict(type='str', choices=['absent', 'present'], default='present'),
-    #                      vlan_id=dict(type='int', required=True))
+    argument_spec.update(snapshot_dir=dict(type='path'),
+                         tenants=dict(type='list'),
+                         indexes=dict(type='bool', default=False))
 
     # seed the result dict in the object
     # we primarily care about changed and state
@@ -88,40 +103,60 @@ def main():
 
     payload = None
 
-    # Get the platform details
-    response = nfvis.request('/operational/platform-detail')
-    if 'platform_info:platform-detail' in response:
-        nfvis.result['platform-detail'] = response['platform_info:platform-detail']
+    # Get the deployments of every tenant in parallel
+    start = time.time()
+    tenant_deployments, tenant_timings = nfvis.tenant_deployments(nfvis.params['tenants'])
+    nfvis.result['tenants'] = list(tenant_deployments)
+    nfvis.result['tenant_timings'] = tenant_timings
+    nfvis.result['tenant_timings_total'] = round(time.time() - start, 3)
+
+    # Get the platform details, CPU allocation, deployment, bridge and network information.
+    # The admin deployments are kept as deployments for compatibility, and only
+    # the other tenants are returned in tenant_deployments
+    facts = dict()
+    for name, url_path, key in NFVIS_FACTS_SECTIONS:
+        if name == 'deployments' and 'admin' in tenant_deployments:
+            facts[name] = tenant_deployments['admin']
+            continue
+        facts[name] = nfvis_facts_section(nfvis.request(url_path), key)
+    tenant_deployments = OrderedDict((tenant, section) for tenant, section in tenant_deployments.items() if tenant != 'admin')
+
+    if nfvis.params['snapshot_dir']:
+        # Only return what changed since the snapshot taken by the previous run
+        snapshot_path = os.path.join(nfvis.params['snapshot_dir'],
+                                     '{0}.json'.format(re.sub('[^A-Za-z0-9_.-]', '_', nfvis.params['host'])))
+        previous = dict()
+        try:
+            with open(snapshot_path) as f:
+                previous = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+        digest = nfvis_facts_digest(facts, tenant_deployments)
+        if nfvis.params['tenants']:
+            # Keep the digests of the tenants that were not asked for this time
+            for tenant, section in previous.get('tenant_deployments', dict()).items():
+                if tenant != 'admin' and tenant not in nfvis.params['tenants']:
+                    digest['tenant_deployments'].setdefault(tenant, section)
+        nfvis.result['section_hashes'] = dict((name, section['hash']) for name, section in digest.items()
+                                              if name != 'tenant_deployments')
+        nfvis.result['section_hashes']['tenant_deployments'] = dict(
+            (tenant, section['hash']) for tenant, section in digest['tenant_deployments'].items() if tenant in tenant_deployments)
+        nfvis.result['changes'] = nfvis_facts_changes(previous, digest, facts, tenant_deployments)
+        try:
+            if not os.path.isdir(nfvis.params['snapshot_dir']):
+                os.makedirs(nfvis.params['snapshot_dir'])
+            fd, tmp = tempfile.mkstemp(dir=nfvis.params['snapshot_dir'])
+            with os.fdopen(fd, 'w') as f:
+                json.dump(digest, f, separators=(',', ':'))
+            os.rename(tmp, snapshot_path)
+        except (IOError, OSError) as e:
+            nfvis.fail_json(msg='Unable to write snapshot {0}: {1}'.format(snapshot_path, to_native(e)))
     else:
-        nfvis.result['platform-detail'] = []
+        nfvis.result.update(facts)
+        nfvis.result['tenant_deployments'] = tenant_deployments
 
-        # Get CPU allocation information
-    response = nfvis.request('/operational/resources/cpu-info/allocation')
-    if 'resources:allocation' in response:
-        nfvis.result['cpu-info'] = response['resources:allocation']
-    else:
-        nfvis.result['cpu-info'] = []
-
-        # Get deployment information
-    response = nfvis.request('/config/vm_lifecycle/tenants/tenant/admin/deployments?deep')
-    if isinstance(response, dict) and 'vmlc:deployments' in response:
-        nfvis.result['deployments'] = response['vmlc:deployments']
-    else:
-        nfvis.result['deployments'] = []
-
-        # Get the bridge information
-    response = nfvis.request('/config/bridges?deep')
-    if 'network:bridges' in response:
-        nfvis.result['bridges'] = response['network:bridges']
-    else:
-        nfvis.result['bridges'] = []
-
-        # Get the network information
-    response = nfvis.request('/config/networks?deep')
-    if 'network:networks' in response:
-        nfvis.result['networks'] = response['network:networks']
-    else:
-        nfvis.result['networks'] = []
+    if nfvis.params['indexes']:
+        nfvis.result['index'] = nfvis_facts_index(facts)
 
     # Check Mode makes to sense with a facts module, just ignore
     if module.check_mode:
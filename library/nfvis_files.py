@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: nfvis_files
+
+short_description: Lists the files in the datastores of an NFVIS host
+
+version_added: "n/a"
+
+description:
+    - "Lists the files (uploads, images, ...) in the datastores of an NFVIS host with their sizes in bytes. The file list is read a page at a time, so hosts with thousands of files are not loaded into memory at once"
+
+options:
+    path:
+        description:
+            - Only return the files under this directory, e.g. /data/intdatastore/uploads
+        required: false
+    pattern:
+        description:
+            - Only return the files whose name matches this shell pattern, e.g. *.tar.gz
+        required: false
+    type:
+        description:
+            - Only return the files of this type, e.g. 'VM Package'
+        required: false
+    page_size:
+        description:
+            - The number of files requested at a time (Default: 100)
+        required: false
+
+author:
+    - Steven Carter
+'''
+
+EXAMPLES = '''
+# List the uploaded packages
+- nfvis_files:
+    host: 1.2.3.4
+    user: admin
+    password: cisco
+    path: /data/intdatastore/uploads
+    pattern: "*.tar.gz"
+'''
+
+RETURN = '''
+files:
+    description: The matching files, with their path, directory, size in bytes, type and modification date
+    type: list
+count:
+    description: The number of matching files
+    type: int
+total_bytes:
+    description: The total size of the matching files in bytes
+    type: int
+directory_bytes:
+    description: The total size of the matching files in bytes by directory
+    type: dict
+'''
+
+import fnmatch
+import posixpath
+from ansible.module_utils.basic import AnsibleModule, json, env_fallback
+from ansible.module_utils._text import to_native
+from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec, nfvis_file_entry, NFVIS_FILES_PATH
+
+def main():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+
+    argument_spec = nfvis_argument_spec()
+    argument_spec.update(path=dict(type='str'),
+                         pattern=dict(type='str'),
+                         type=dict(type='str'),
+                         page_size=dict(type='int', default=100))
+
+    # seed the result dict in the object
+    # we primarily care about changed and state
+    # change is if this module effectively modified the target
+    # state will include any data that you want your module to pass back
+    # for consumption, for example, in a subsequent task
+    result = dict(
+        changed=False,
+    )
+    # the AnsibleModule object will be our abstraction working with Ansible
+    # this includes instantiation, a couple of common attr would be the
+    # args/params passed to the execution, as well as if the module
+    # supports check mode
+    module = AnsibleModule(argument_spec=argument_spec,
+                           supports_check_mode=True)
+    nfvis = nfvisModule(module)
+
+    if nfvis.params['page_size'] < 1:
+        nfvis.fail_json(msg='page_size must be at least 1')
+
+    directory = nfvis.params['path'].rstrip('/') if nfvis.params['path'] else None
+
+    # Stream the file list, keeping only the matching files
+    files = []
+    total_bytes = 0
+    directory_bytes = dict()
+    for item in nfvis.request_pages('{0}?deep'.format(NFVIS_FILES_PATH), 'collection.system:local',
+                                    page_size=nfvis.params['page_size'], operation='get_files'):
+        entry = nfvis_file_entry(item)
+        if directory and entry['directory'] != directory and not entry['directory'].startswith(directory + '/'):
+            continue
+        if nfvis.params['pattern'] and not fnmatch.fnmatch(posixpath.basename(entry['path']), nfvis.params['pattern']):
+            continue
+        if nfvis.params['type'] and entry['type'] != nfvis.params['type']:
+            continue
+        files.append(entry)
+        total_bytes += entry['size'] or 0
+        directory_bytes[entry['directory']] = directory_bytes.get(entry['directory'], 0) + (entry['size'] or 0)
+
+    nfvis.result['files'] = files
+    nfvis.result['count'] = len(files)
+    nfvis.result['total_bytes'] = total_bytes
+    nfvis.result['directory_bytes'] = directory_bytes
+
+    nfvis.exit_json(**nfvis.result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: nfvis_job
+
+short_description: Checks many async jobs of the nfvis modules in one call
+
+version_added: "n/a"
+
+description:
+    - "Checks many jobs started with 'async' and 'poll: 0' (for example long nfvis_package uploads or nfvis_deployment waits) in one call, optionally waiting for them to finish, instead of one async_status task per job. The job files are read from the async directory of the machine that ran the jobs, so this module has to run there as well"
+
+options:
+    jobs:
+        description:
+            - The jobs to check, as job ids or as the registered results of the tasks that started them. Job ids have Ansible's form, e.g. j937044290214.24526
+        required: true
+    async_dir:
+        description:
+            - The directory the jobs were started with (Default: $ANSIBLE_ASYNC_DIR or ~/.ansible_async)
+        required: false
+    wait:
+        description:
+            - Wait until none of the jobs is running (Default: false)
+        required: false
+    wait_timeout:
+        description:
+            - The time to wait for the jobs with wait (Default: 300)
+        required: false
+    cleanup:
+        description:
+            - Delete the files of the jobs that are done (Default: true)
+        required: false
+
+author:
+    - Steven Carter
+'''
+
+EXAMPLES = '''
+# Upload a package to every host without holding a fork per upload
+- nfvis_package:
+    host: "{{ inventory_hostname }}"
+    user: admin
+    password: cisco
+    file: asav.tar.gz
+    name: asav
+  async: 3600
+  poll: 0
+  register: upload
+  delegate_to: localhost
+
+# Wait for all of the uploads at once
+- nfvis_job:
+    jobs: "{{ ansible_play_hosts | map('extract', hostvars, 'upload') | list }}"
+    wait: true
+    wait_timeout: 3600
+  run_once: true
+  delegate_to: localhost
+'''
+
+RETURN = '''
+jobs:
+    description: The jobs by id, with their state ('running', 'finished', 'failed' or 'unknown'), the module result once done and the seconds a running job has been running
+    type: dict
+running_jobs:
+    description: The ids of the jobs that are still running
+    type: list
+finished_jobs:
+    description: The ids of the jobs that finished
+    type: list
+failed_jobs:
+    description: The ids of the jobs that failed or are unknown
+    type: list
+'''
+
+import time
+from ansible.module_utils.basic import AnsibleModule, env_fallback
+from ansible.module_utils._text import to_native
+from ansible.module_utils.nfvis import nfvis_job_id, nfvis_job_status, nfvis_job_cleanup, NFVIS_ASYNC_DIR, NFVIS_ASYNC_DIR_ENV
+
+def main():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+
+    argument_spec = dict(jobs=dict(type='list', required=True),
+                         async_dir=dict(type='path', default=NFVIS_ASYNC_DIR, fallback=(env_fallback, [NFVIS_ASYNC_DIR_ENV])),
+                         wait=dict(type='bool', default=False),
+                         wait_timeout=dict(type='int', default=300),
+                         cleanup=dict(type='bool', default=True))
+
+    module = AnsibleModule(argument_spec=argument_spec,
+                           supports_check_mode=True)
+    result = dict(changed=False)
+
+    # Accept the registered results of the tasks that started the jobs as well
+    # as their ids, and ignore skipped tasks, which have no job id
+    job_ids = []
+    for job in module.params['jobs']:
+        try:
+            job_id = nfvis_job_id(job)
+        except ValueError as e:
+            module.fail_json(msg=to_native(e))
+        if job_id is not None and job_id not in job_ids:
+            job_ids.append(job_id)
+
+    deadline = time.time() + module.params['wait_timeout']
+    interval = 1
+    while True:
+        jobs = dict((job_id, nfvis_job_status(module.params['async_dir'], job_id)) for job_id in job_ids)
+        running = [job_id for job_id in job_ids if jobs[job_id]['state'] == 'running']
+        if not running or not module.params['wait'] or time.time() >= deadline:
+            break
+        time.sleep(min(interval, max(deadline - time.time(), 0)))
+        interval = min(interval * 2, 15)
+
+    result['jobs'] = jobs
+    result['running_jobs'] = running
+    result['finished_jobs'] = [job_id for job_id in job_ids if jobs[job_id]['state'] == 'finished']
+    result['failed_jobs'] = [job_id for job_id in job_ids if jobs[job_id]['state'] in ['failed', 'unknown']]
+    # Changed when any of the jobs changed its host
+    result['changed'] = any((jobs[job_id].get('result') or {}).get('changed') for job_id in result['finished_jobs'])
+
+    if module.params['cleanup'] and not module.check_mode:
+        for job_id in result['finished_jobs'] + result['failed_jobs']:
+            if jobs[job_id]['state'] != 'unknown':
+                nfvis_job_cleanup(module.params['async_dir'], job_id)
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -88,23 +88,15 @@ message:
 import os
 from ansible.module_utils.basic import AnsibleModule, json, env_fallback
 from ansible.module_utils._text import to_native
-from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec
+from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec, nfvis_diff, nfvis_changed_fields
+from ansible.module_utils.nfvis import nfvis_network_spec, nfvis_network_desired, nfvis_network_payload
 
 def main():
     # define the available arguments/parameters that a user can pass to
     # the module
 
     argument_spec = nfvis_argument_spec()
-    argument_spec.update(state=dict(type='str', choices=['absent', 'present'], default='present'),
-                         name=dict(type='str', required=True, aliases=['network']),
-                         bridge=dict(type='str'),
-                         trunk=dict(type='bool', default=True),
-                         sriov=dict(type='bool', default=False),
-                         native_tagged=dict(type='bool'),
-                         native_vlan=dict(type='str'),
-                         vlan=dict(type='int'),
-                         )
-
+    argument_spec.update(nfvis_network_spec())
 
 
     # seed the result dict in the object
@@ -146,26 +138,17 @@ def main():
     except KeyError:
         pass
 
+    # Build the desired state of the network from the params
+    desired = nfvis_network_desired(nfvis.params)
+
     if nfvis.params['state'] == 'present':
         if nfvis.params['name'] not in network_dict:
 
             # Construct the payload
-            payload = {'network': {}}
-            payload['network']['name'] = nfvis.params['name']
-            if nfvis.params['bridge']:
-                payload['network']['bridge'] = nfvis.params['bridge']
-            else:
-                module.fail_json(msg="bridge must be specified when state is present")
-
-            if nfvis.params['trunk'] == False:
-                payload['network']['trunk'] = nfvis.params['trunk']
-                if nfvis.params['vlan']:
-                    payload['network']['vlan'] = nfvis.params['vlan']
-
-            if nfvis.params['sriov']:
-                payload['network']['sriov'] = nfvis.params['sriov']
-            if nfvis.params['native_vlan']:
-                payload['network']['native-vlan'] = nfvis.params['native_vlan']
+            try:
+                payload = nfvis_network_payload(nfvis.params)
+            except ValueError as e:
+                module.fail_json(msg=to_native(e))
 
             # The network does not exist on the device, so add it
             url_path = '/config/networks'
@@ -174,48 +157,14 @@ def main():
             nfvis.result['changed'] = True
 
         else:
-            # The bridge exists on the device, so let's start with the original payload and see if anything changed
-            payload = {'network': network_dict[nfvis.params['name']]}
-
-            if payload['network']['bridge'] != nfvis.params['bridge']:
-                payload['network']['bridge'] = nfvis.params['bridge']
-                nfvis.result['what_changed'].append('bridge')
-
-            if nfvis.params['trunk'] == False:
-                if 'trunk' not in payload['network'] or payload['network']['trunk'] == True:
-                    payload['network']['trunk'] = False
-                    nfvis.result['what_changed'].append('trunk')
-                if nfvis.params['vlan']:
-                    if 'vlan' not in payload['network']:
-                        payload['network']['vlan'] = nfvis.params['vlan']
-                        nfvis.result['what_changed'].append('vlan1')
-                    elif isinstance(payload['network']['vlan'], list) and str(nfvis.params['vlan']) not in payload['network']['vlan']:
-                        payload['network']['vlan'] = nfvis.params['vlan']
-                        nfvis.result['what_changed'].append('vlan2')
-                    elif isinstance(payload['network']['vlan'], str) and nfvis.params['vlan'] != int(payload['network']['vlan']):
-                        payload['network']['vlan'] = nfvis.params['vlan']
-                        nfvis.result['what_changed'].append('vlan3')
-
-            if nfvis.params['sriov']:
-                if 'sriov' not in payload['network'] or nfvis.params['sriov'] != payload['network']['sriov']:
-                    payload['network']['sriov'] = nfvis.params['sriov']
-                    nfvis.result['what_changed'].append('sriov')
-
-            if nfvis.params['native_tagged']:
-                if 'native_tagged' not in payload['network'] or nfvis.params['native_tagged'] != payload['network']['native_tagged']:
-                    payload['network']['native_tagged'] = nfvis.params['native_tagged']
-                    nfvis.result['what_changed'].append('native_tagged')
-
-            if nfvis.params['native_vlan']:
-                if 'native_vlan' not in payload['network'] or nfvis.params['native_vlan'] != payload['network']['native_vlan']:
-                    payload['network']['native_vlan'] = nfvis.params['native_vlan']
-                    nfvis.result['what_changed'].append('native_vlan')
-
-            if nfvis.result['what_changed']:
+            # The network exists on the device, so compare it against the desired state
+            changes = nfvis_diff(desired, {'network': network_dict[nfvis.params['name']]})
+            nfvis.result['what_changed'] = nfvis_changed_fields(changes)
+
+            if changes:
                 url_path = '/config/networks/network/{0}'.format(nfvis.params['name'])
                 nfvis.result['changed'] = True
-                if not module.check_mode:
-                    response = nfvis.request(url_path, method='PUT', payload=json.dumps(payload))
+                nfvis.update(url_path, {'network': network_dict[nfvis.params['name']]}, changes)
 
     else:
         if nfvis.params['name'] in network_dict:
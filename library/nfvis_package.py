@@ -23,15 +23,35 @@ description:
 options:
     name:
         description:
-            - The name of the package
-        required: true
+            - The name of the package. Required unless state is 'pruned'
+        required: false
     state:
         description:
-            - The state if the bridge ('present' or 'absent') (Default: 'present')
+            - The state if the bridge ('present' or 'absent'), or 'pruned' to delete every image that no deployment uses (Default: 'present')
         required: false
     file:
         description:
-            - The file name of the package
+            - The file name of the package. Required when state is 'present'
+        required: false
+    dest:
+        description:
+            - The directory on the host to which the package is uploaded (Default: /data/intdatastore/uploads)
+        required: false
+    datastores:
+        description:
+            - Upload directories to fall back to, in order, when dest does not have room for the package
+        required: false
+    space_check:
+        description:
+            - Check that the datastore has room for the package before uploading it (Default: true)
+        required: false
+    unpack_factor:
+        description:
+            - The space needed on the datastore as a multiple of the package size, to leave room for unpacking the image (Default: 2.0)
+        required: false
+    keep:
+        description:
+            - Images that are never deleted when state is 'pruned'
         required: false
 
 author:
@@ -49,6 +69,19 @@ EXAMPLES = '''
     name: asav
     state: present
 
+# Upload a package to the first datastore with room for it
+- name: Package
+  nfvis_package:
+    host: 1.2.3.4
+    user: admin
+    password: cisco
+    file: asav.tar.gz
+    name: asav
+    dest: /data/intdatastore/uploads
+    datastores:
+      - /mnt/extdatastore1/uploads
+    state: present
+
 # Deregister a package
 - name: Package
   nfvis_package:
@@ -57,6 +90,28 @@ EXAMPLES = '''
     password: cisco
     name: asav
     state: absent
+
+# Delete every image that is not used by a deployment
+- name: Prune packages
+  nfvis_package:
+    host: 1.2.3.4
+    user: admin
+    password: cisco
+    state: pruned
+    keep:
+      - asav
+
+# Upload as an async job and check on it later with nfvis_job
+- name: Package
+  nfvis_package:
+    host: 1.2.3.4
+    user: admin
+    password: cisco
+    file: asav.tar.gz
+    name: asav
+  async: 3600
+  poll: 0
+  register: upload
 '''
 
 RETURN = '''
@@ -69,11 +124,13 @@ message:
 
 # import requests
 import os.path
+import time
 # from requests.auth import HTTPBasicAuth
 # from paramiko import SSHClient
 # from scp import SCPClient
 from ansible.module_utils.basic import AnsibleModule, json
-from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec
+from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec, nfvis_as_list, nfvis_deployment_images, nfvis_file_entry, nfvis_image_delete_requests, NFVIS_FILES_PATH
+from ansible.module_utils.nfvis import nfvis_disk_space, nfvis_disk_for_path, NFVIS_DISK_SPACE_PATH
 
 try:
     import paramiko
@@ -90,10 +147,14 @@ except ImportError:
 def run_module():
     # define available arguments/parameters a user can pass to the module
     argument_spec = nfvis_argument_spec()
-    argument_spec.update(state=dict(type='str', choices=['absent', 'present'], default='present'),
-                         name=dict(type='str', required=True),
-                         file=dict(type='str', required=True),
+    argument_spec.update(state=dict(type='str', choices=['absent', 'present', 'pruned'], default='present'),
+                         name=dict(type='str'),
+                         file=dict(type='str'),
                          dest=dict(type='str', default='/data/intdatastore/uploads'),
+                         datastores=dict(type='list', default=[]),
+                         space_check=dict(type='bool', default=True),
+                         unpack_factor=dict(type='float', default=2.0),
+                         keep=dict(type='list', default=[]),
                          )
 
     # seed the result dict in the object
@@ -113,16 +174,18 @@ def run_module():
     # supports check mode
     module = AnsibleModule(argument_spec=argument_spec,
                            supports_check_mode=True,
+                           required_if=[['state', 'present', ['name', 'file']],
+                                        ['state', 'absent', ['name']]],
                            )
     nfvis = nfvisModule(module)
 
-    if not HAS_PARAMIKO:
+    if nfvis.params['state'] == 'present' and not HAS_PARAMIKO:
         nfvis.fail_json(
             msg='library paramiko is required when file_pull is False but does not appear to be '
                 'installed. It can be installed using `pip install paramiko`'
         )
 
-    if not HAS_SCP:
+    if nfvis.params['state'] == 'present' and not HAS_SCP:
         nfvis.fail_json(
             msg='library scp is required when file_pull is False but does not appear to be '
                 'installed. It can be installed using `pip install scp`'
@@ -136,7 +199,7 @@ def run_module():
     # Turn the list of dictionaries returned in the call into a dictionary of dictionaries hashed by the deployment name
     images_dict = {}
     try:
-        for item in response['vmlc:images']['image']:
+        for item in nfvis_as_list(response['vmlc:images']['image']):
             name = item['name']
             images_dict[name] = item
     except TypeError:
@@ -146,6 +209,32 @@ def run_module():
 
     if nfvis.params['state'] == 'present':
         if nfvis.params['name'] not in images_dict:
+            dest = nfvis.params['dest']
+            if nfvis.params['space_check']:
+                # Make sure that the package fits before sending it over the WAN
+                start = time.time()
+                try:
+                    required = int(os.path.getsize(nfvis.params['file']) * nfvis.params['unpack_factor'])
+                except OSError as e:
+                    nfvis.fail_json(msg='Unable to read {0}: {1}'.format(nfvis.params['file'], e))
+                disks = nfvis_disk_space(nfvis.request(NFVIS_DISK_SPACE_PATH, fail=False))
+                available = dict()
+                dest = None
+                for candidate in [nfvis.params['dest']] + nfvis.params['datastores']:
+                    disk = nfvis_disk_for_path(disks, candidate)
+                    available[candidate] = disk['available'] if disk else None
+                    if available[candidate] is None or available[candidate] >= required:
+                        # Unknown free space does not block the upload
+                        dest = candidate
+                        break
+                nfvis.result['space_check'] = dict(required=required, available=available, dest=dest,
+                                                   seconds=round(time.time() - start, 3))
+                if dest is None:
+                    nfvis.fail_json(msg='Not enough space for {0}: {1} bytes needed, available: {2}'.format(
+                        nfvis.params['file'], required, ', '.join('{0}: {1}'.format(k, v) for k, v in available.items())))
+                if available[dest] is None:
+                    module.warn('Unable to determine the free space of {0}'.format(dest))
+
             if not module.check_mode:
                 try:
                     ssh = paramiko.SSHClient()
@@ -164,7 +253,7 @@ def run_module():
 
                 try:
                     with SCPClient(ssh.get_transport()) as scp:
-                        scp.put(module.params['file'], '/data/intdatastore/uploads/{0}.tar.gz'.format(nfvis.params['name']))
+                        scp.put(module.params['file'], '{0}/{1}.tar.gz'.format(dest, nfvis.params['name']))
                 except Exception as e:
                     nfvis.fail_json(msg="Operation error: %s" % e)
 
@@ -172,28 +261,51 @@ def run_module():
 
             payload = {'image': {}}
             payload['image']['name'] = nfvis.params['name']
-            payload['image']['src'] = 'file://{0}/{1}.tar.gz'.format(nfvis.params['dest'], nfvis.params['name'])
+            payload['image']['src'] = 'file://{0}/{1}.tar.gz'.format(dest, nfvis.params['name'])
 
             url_path = '/config/vm_lifecycle/images'
             if not module.check_mode:
                 response = nfvis.request(url_path, method='POST', payload=json.dumps(payload))
             nfvis.result['changed'] = True
+    elif nfvis.params['state'] == 'pruned':
+        # Find the images that no deployment of any tenant uses
+        tenant_deployments, tenant_timings = nfvis.tenant_deployments()
+        used = set()
+        for section in tenant_deployments.values():
+            for deployment in nfvis_as_list(section.get('deployment') if isinstance(section, dict) else None):
+                used.update(nfvis_deployment_images(deployment))
+        unused = [name for name in sorted(images_dict) if name not in used and name not in nfvis.params['keep']]
+
+        def image_file(name):
+            src = images_dict[name].get('src') or ''
+            return src.split('://')[1] if '://' in src else None
+
+        # Look up the sizes of the files of the unused images
+        sizes = dict()
+        files = set(image_file(name) for name in unused) - set([None])
+        if files:
+            for item in nfvis.request_pages('{0}?deep'.format(NFVIS_FILES_PATH), 'collection.system:local', operation='get_files'):
+                entry = nfvis_file_entry(item)
+                if entry['path'] in files:
+                    sizes[entry['path']] = entry['size']
+
+        def prune(name):
+            for method, path, payload in nfvis_image_delete_requests(images_dict[name]):
+                nfvis.request(path, method=method, payload=payload)
+
+        # Delete the images and their files, max_concurrency images at a time
+        if unused and not module.check_mode:
+            nfvis.parallel(prune, unused)
+        nfvis.result['pruned'] = unused
+        nfvis.result['pruned_files'] = sorted(files)
+        nfvis.result['reclaimed_bytes'] = sum(size or 0 for size in sizes.values())
+        nfvis.result['changed'] = bool(unused)
     else:
         if nfvis.params['name'] in images_dict:
-            # Delete the image
-            url_path = '/config/vm_lifecycle/images/image/{0}'.format(nfvis.params['name'])
-            if not module.check_mode:
-                response = nfvis.request(url_path, method='DELETE')
-
-            # Delete the file
-            filename = (images_dict[nfvis.params['name']]['src'].split('://'))[1]
-            payload = {
-                'input': { 'name': filename }
-            }
-
-            url_path = '/operations/system/file-delete/file'
-            if not module.check_mode:
-                response = nfvis.request(url_path, method='POST', payload=json.dumps(payload))
+            # Delete the image, then its file
+            for method, url_path, payload in nfvis_image_delete_requests(images_dict[nfvis.params['name']]):
+                if not module.check_mode:
+                    response = nfvis.request(url_path, method=method, payload=payload)
             nfvis.result['changed'] = True
 
         else:
@@ -62,13 +62,7 @@ message:
 import os
 from ansible.module_utils.basic import AnsibleModule, json, env_fallback
 from ansible.module_utils._text import to_native
-from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec
-
-try:
-    import netaddr
-    HAS_NETADDR = True
-except:
-    HAS_NETADDR = False
+from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec, nfvis_diff, nfvis_changed_fields, nfvis_system_spec, nfvis_system_desired
 
 
 def main():
@@ -76,12 +70,7 @@ def main():
     # the module
 
     argument_spec = nfvis_argument_spec()
-    argument_spec.update(hostname=dict(type='str', required=True),
-                         trusted_source=dict(type='list'),
-                         dpdk=dict(type='bool'),
-                         mgmt=dict(type='str', required=True),
-                         default_gw=dict(type='str')
-                         )
+    argument_spec.update(nfvis_system_spec())
 
     # seed the result dict in the object
     # we primarily care about changed and state
@@ -99,75 +88,31 @@ def main():
                            supports_check_mode=True,
                            )
 
-    if not HAS_NETADDR:
-        module.fail_json(msg='Could not import the python library netaddr required by this module')
-
     nfvis = nfvisModule(module)
 
-
-
     payload = None
     port = None
     nfvis.result['changed'] = False
-    # Make sure that we have a righteous mgmt IP address
+
+    # Build the desired state of the settings from the params
     try:
-        mgmt_ip = netaddr.IPNetwork(nfvis.params['mgmt'])
-    except ValueError:
-        module.fail_json(msg="mgmt address/netmask is invalid: {0}".format(nfvis.params['mgmt']))
+        desired = nfvis_system_desired(nfvis.params)
+    except ValueError as e:
+        module.fail_json(msg=to_native(e))
 
     # Get the list of existing vlans
     response = nfvis.request('/config/system/settings')
     nfvis.result['current'] = response
     nfvis.result['what_changed'] = []
 
-    payload = {'settings':response['system:settings']}
-    if nfvis.params['hostname'] and nfvis.params['hostname'].split('.')[0] != payload['settings']['hostname']:
-        payload['settings']['hostname'] = nfvis.params['hostname'].split('.')[0]
-        nfvis.result['what_changed'].append('hostname')
-    if nfvis.params['trusted_source']:
-        ip_receive_acl = []
-        for network in nfvis.params['trusted_source']:
-            ip_receive_acl.append({'source': network, 'action': 'accept', 'priority': 0, 'service': ['https', 'icmp', 'netconf', 'scpd', 'snmp', 'ssh']})
-        if 'ip-receive-acls' in payload['settings'] and 'ip-receive-acl' in payload['settings']['ip-receive-acls']:
-            if payload['settings']['ip-receive-acls']['ip-receive-acl'] != ip_receive_acl:
-                nfvis.result['what_changed'].append('trusted_source')
-                payload['settings']['ip-receive-acls'] = {'ip-receive-acl': ip_receive_acl}
-        else:
-            nfvis.result['what_changed'].append('trusted_source')
-            payload['settings']['ip-receive-acls'] = {'ip-receive-acl': ip_receive_acl}
-    if nfvis.params['dpdk'] and (('dpdk' in payload['settings'] and nfvis.params['dpdk'] != payload['settings']['dpdk']) or ('dpdk' not in payload['settings'])):
-        payload['settings']['dpdk'] = ['disable', 'enable'][nfvis.params['dpdk'] == True]
-        nfvis.result['what_changed'].append('dpdk')
-    if 'mgmt' in payload['settings']:
-        if nfvis.params['mgmt'] == 'dhcp' and 'dhcp' not in payload['settings']['mgmt']:
-            payload['settings']['mgmt']['dhcp'] = None
-            nfvis.result['what_changed'].append('mgmt')
-        else:
-            if 'address' not in payload['settings']['mgmt']['ip'] or 'netmask' not in payload['settings']['mgmt']['ip']:
-                payload['settings']['mgmt']['ip'] = {'address': str(mgmt_ip.ip), 'netmask': str(mgmt_ip.netmask)}
-                nfvis.result['what_changed'].append('mgmt_added')
-            elif payload['settings']['mgmt']['ip']['address'] != str(mgmt_ip.ip):
-                payload['settings']['mgmt']['ip'] = {'address': str(mgmt_ip.ip), 'netmask': str(mgmt_ip.netmask)}
-                nfvis.result['what_changed'].append('mgmt_ip')
-            elif payload['settings']['mgmt']['ip']['netmask'] != str(mgmt_ip.netmask):
-                payload['settings']['mgmt']['ip'] = {'address': str(mgmt_ip.ip), 'netmask': str(mgmt_ip.netmask)}
-                nfvis.result['what_changed'].append('mgmt_netmask')
-    else:
-            payload['settings']['mgmt'] = {}
-            payload['settings']['mgmt']['ip'] = {'address': str(mgmt_ip.ip), 'netmask': str(mgmt_ip.netmask)}
-            nfvis.result['what_changed'].append('mgmt')
-    if nfvis.params['default_gw']:
-        if 'default-gw' in payload['settings'] and payload['settings']['default-gw'] != nfvis.params['default_gw']:
-            payload['settings']['default-gw'] = nfvis.params['default_gw']
-            nfvis.result['what_changed'].append('default_gw')
-        elif 'default-gw' not in payload['settings']:
-            payload['settings']['default-gw'] = nfvis.params['default_gw']
-            nfvis.result['what_changed'].append('default_gw')
-    if nfvis.result['what_changed']:
+    current = {'settings': response['system:settings']}
+    changes = nfvis_diff(desired, current)
+    nfvis.result['what_changed'] = nfvis_changed_fields(changes)
+
+    if changes:
         nfvis.result['changed'] = True
         url_path = '/config/system/settings'
-        if not module.check_mode:
-            response = nfvis.request(url_path, method='PUT', payload=json.dumps(payload))
+        nfvis.update(url_path, current, changes)
 
     nfvis.exit_json(**nfvis.result)
 
@@ -10,21 +10,22 @@ DOCUMENTATION = '''
 ---
 module: nfvis_vlan
 
-short_description: This is my sample module
+short_description: Manages the VLANs of an NFVIS host
 
 version_added: "2.4"
 
 description:
-    - "Create a VLAN on an NFVIS host"
+    - "Creates or deletes VLANs on an NFVIS host. VLANs are given as ranges, all of the VLANs to create are sent in one request and the VLANs to delete are deleted in parallel"
 
 options:
     vlan_id:
         description:
-            - The VLAN ID of the VLAN.
+            - The VLAN IDs, as a number, a range string such as `100-199,300` or a list of either.
         required: true
+        aliases: ['vlans']
     state:
         description:
-            - The state of the VLAN (i.e. `present` or `absent`)
+            - The state of the VLANs (i.e. `present` or `absent`)
         required: false
 
 author:
@@ -32,7 +33,7 @@ author:
 '''
 
 EXAMPLES = '''
-# Create VLAN 10
+# Create VLAN 100
 - nfvis_vlan:
     host: 1.2.3.4
     user: admin
@@ -40,7 +41,15 @@ EXAMPLES = '''
     state: present
     vlan_id: 100
 
-# Delete VLAN 10
+# Create VLANs 100 to 199 and 300
+- nfvis_vlan:
+    host: 1.2.3.4
+    user: admin
+    password: cisco
+    state: present
+    vlans: 100-199,300
+
+# Delete VLAN 100
 - nfvis_vlan:
     host: 1.2.3.4
     user: admin
@@ -50,17 +59,22 @@ EXAMPLES = '''
 '''
 
 RETURN = '''
-original_message:
-    description: The original name param that was passed in
+vlans:
+    description: The VLANs on the host after the change, as a range string
+    type: str
+added:
+    description: The VLANs that were created, as a range string
+    type: str
+removed:
+    description: The VLANs that were deleted, as a range string
     type: str
-message:
-    description: The output message that the sample module generates
 '''
 
 import os
 from ansible.module_utils.basic import AnsibleModule, json, env_fallback
 from ansible.module_utils._text import to_native
-from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec
+from ansible.module_utils.nfvis import nfvisModule, nfvis_argument_spec, nfvis_as_list
+from ansible.module_utils.nfvis import nfvis_ranges, nfvis_ranges_from_ids, nfvis_ranges_merge, nfvis_ranges_subtract, nfvis_ranges_intersect, nfvis_ranges_ids, nfvis_ranges_format
 
 def main():
     # define the available arguments/parameters that a user can pass to
@@ -68,7 +82,7 @@ def main():
 
     argument_spec = nfvis_argument_spec()
     argument_spec.update(state=dict(type='str', choices=['absent', 'present'], default='present'),
-                         vlan_id=dict(type='int', required=True))
+                         vlan_id=dict(type='raw', required=True, aliases=['vlans']))
 
     # seed the result dict in the object
     # we primarily care about changed and state
@@ -89,40 +103,53 @@ def main():
     payload = None
     nfvis.result['changed'] = False
 
+    try:
+        requested = nfvis_ranges(nfvis.params['vlan_id'])
+    except ValueError as e:
+        nfvis.fail_json(msg='Invalid vlan_id: {0}'.format(to_native(e)))
+
     # Get the list of existing vlans
     url_path = '/running/switch/vlan?deep'
     response = nfvis.request(url_path, method='GET', operation='get_vlan')
     nfvis.result['current'] = response
-    
-    # Turn the list of dictionaries returned in the call into a dictionary of dictionaries hashed by the bridge name
-    vlan_dict = {}
-    try:
-        for item in response['collection']['switch:vlan']:
-            name = item['vlan-id']
-            vlan_dict[name] = item
-    except TypeError:
-        pass
-    except KeyError:
-        pass
 
+    # Collapse the VLANs on the device into ranges, so the comparison is done range by range
+    existing_ids = []
+    try:
+        vlans = nfvis_as_list(response['collection']['switch:vlan'])
+    except (TypeError, KeyError):
+        vlans = []
+    for item in vlans:
+        try:
+            existing_ids.append(int(item['vlan-id']))
+        except (TypeError, KeyError, ValueError):
+            pass
+    existing = nfvis_ranges_from_ids(existing_ids)
+
+    added = []
+    removed = []
     if nfvis.params['state'] == 'present':
-        # Construct the payload
-        payload = {'vlan':{}}
-        payload['vlan']['vlan-id'] = nfvis.params['vlan_id']
-
-        if nfvis.params['vlan_id'] not in vlan_dict:
-            # The vlan does not exist on the device, so add it
-            url_path = '/running/switch'
+        added = nfvis_ranges_subtract(requested, existing)
+        if added:
+            # Merge all of the missing VLANs into the switch with a single request
+            payload = {'switch': {'vlan': [{'vlan-id': vlan_id} for vlan_id in nfvis_ranges_ids(added)]}}
             if not module.check_mode:
-                response = nfvis.request(url_path, method='POST', payload=json.dumps(payload))
+                nfvis.request('/running/switch', method='PATCH', payload=json.dumps(payload))
             nfvis.result['changed'] = True
     else:
-        if nfvis.params['name'] in vlan_dict:
-            url = '/running/switch/vlan/{0}'.format(nfvis.params['vlan_id'])
+        removed = nfvis_ranges_intersect(requested, existing)
+        if removed:
+            # There is no bulk delete for list entries, so delete the VLANs in
+            # parallel, each through its own resource, and leave the rest of
+            # the switch configuration alone
             if not module.check_mode:
-                response = nfvis.request(url, 'DELETE')
+                nfvis.parallel(lambda vlan_id: nfvis.request('/running/switch/vlan/{0}'.format(vlan_id), 'DELETE'),
+                               nfvis_ranges_ids(removed))
             nfvis.result['changed'] = True
 
+    nfvis.result['added'] = nfvis_ranges_format(added)
+    nfvis.result['removed'] = nfvis_ranges_format(removed)
+    nfvis.result['vlans'] = nfvis_ranges_format(nfvis_ranges_subtract(nfvis_ranges_merge(existing + added), removed))
 
     # if the user is working with this module in only check mode we do not
     # want to make any changes to the environment, just return the current
@@ -1,24 +1,1538 @@
 from __future__ import absolute_import, division, print_function
 __metaclass__ = type
 import os
+import io
+import gzip
+import hashlib
+import copy
+import time
+import codecs
+import zlib
+import inspect
+import tempfile
+import random
+import threading
+import re
+import socket
+from collections import OrderedDict
 from ansible.module_utils.basic import AnsibleModule, json, env_fallback
 from ansible.module_utils.urls import fetch_url
 from ansible.module_utils._text import to_native, to_bytes, to_text
+from ansible.module_utils.six import string_types, binary_type
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+try:
+    import netaddr
+    HAS_NETADDR = True
+except ImportError:
+    HAS_NETADDR = False
+
+# Where Ansible's async wrapper keeps the state and result of every async job, see nfvis_job
+NFVIS_ASYNC_DIR_ENV = 'ANSIBLE_ASYNC_DIR'
+NFVIS_ASYNC_DIR = '~/.ansible_async'
+# The ids the async wrapper gives jobs, e.g. j937044290214.24526
+NFVIS_JOB_ID_RE = re.compile(r'^j?[0-9]+\.[0-9]+$')
+
+# Environment variables controlling the record/replay cassette
+NFVIS_CASSETTE_ENV = 'NFVIS_CASSETTE'
+NFVIS_CASSETTE_MODE_ENV = 'NFVIS_CASSETTE_MODE'
+
+# Result keys that echo whole collections back to the controller
+NFVIS_COLLECTION_RESULT_KEYS = ['current', 'debug']
+# Result keys that describe the last request
+NFVIS_REQUEST_RESULT_KEYS = ['response', 'status', 'url', 'method']
+# Payloads larger than this are replaced by their hash and size unless result_detail is full
+NFVIS_RESULT_MAX_PAYLOAD = 1024
+
+# Methods that can safely be sent again when a request fails
+NFVIS_IDEMPOTENT_METHODS = ['GET', 'PUT', 'DELETE']
+# Statuses that mean the NFVIS host is busy or unreachable rather than that the request was wrong
+NFVIS_RETRY_STATUSES = [-1, 429, 500, 502, 503, 504]
+# Upper bound of a single retry delay in seconds
+NFVIS_RETRY_MAX_DELAY = 30
+
+# The sections returned by nfvis_facts: (fact name, API path, key of the section in the response)
+NFVIS_FACTS_SECTIONS = [
+    ('platform-detail', '/operational/platform-detail', 'platform_info:platform-detail'),
+    ('cpu-info', '/operational/resources/cpu-info/allocation', 'resources:allocation'),
+    ('deployments', '/config/vm_lifecycle/tenants/tenant/admin/deployments?deep', 'vmlc:deployments'),
+    ('bridges', '/config/bridges?deep', 'network:bridges'),
+    ('networks', '/config/networks?deep', 'network:networks'),
+]
+# The tenants, and the deployments of one tenant
+NFVIS_TENANTS_PATH = '/config/vm_lifecycle/tenants'
+NFVIS_TENANT_DEPLOYMENTS_PATH = '/config/vm_lifecycle/tenants/tenant/{0}/deployments?deep'
+# The files in the datastores, as a collection that can be paged
+NFVIS_FILES_PATH = '/operational/system/file-list/disk/local'
+# Multipliers of the unit suffixes in file sizes such as '1.2G'
+NFVIS_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4, 'P': 1024 ** 5}
+# The free space of the disks and datastores
+NFVIS_DISK_SPACE_PATH = '/operational/system/disk-space?deep'
+# Where the disks that are reported without a mount point are mounted
+NFVIS_DISK_MOUNTS = {'lv_data': '/data', 'intdatastore': '/data/intdatastore',
+                     'extdatastore1': '/mnt/extdatastore1', 'extdatastore2': '/mnt/extdatastore2'}
+# The vm_group settings compared against the device to detect drift
+NFVIS_DEPLOYMENT_FINGERPRINT_KEYS = ['image', 'flavor', 'interfaces', 'config_data']
+# The subset of those that NFVIS can change without redeploying the VNF
+NFVIS_DEPLOYMENT_MUTABLE_KEYS = ['flavor', 'interfaces']
+# Ports are only ever added to the ones already on a bridge
+NFVIS_BRIDGE_MERGE_KEYS = {'bridge.port': 'name'}
+# The operational state of the deployments of one tenant, which lists a deployment until its VMs are gone
+NFVIS_TENANT_OPDATA_PATH = '/operational/vm_lifecycle/opdata/tenants/tenant/{0}/deployments'
+# The notification stream that VM lifecycle events are published on, as server-sent events
+NFVIS_EVENT_STREAM_PATH = '/stream/{0}'
+# The VM lifecycle event, and the operational states, of a deployment that has booted
+NFVIS_ALIVE_EVENTS = ['VM_ALIVE']
+NFVIS_ALIVE_STATES = ['VM_ALIVE_STATE', 'SERVICE_ACTIVE_STATE']
+# The bridges and networks that NFVIS creates itself
+NFVIS_DEFAULT_BRIDGES = ['wan-br', 'wan2-br', 'lan-br', 'int-mgmt-br']
+NFVIS_DEFAULT_NETWORKS = ['wan-net', 'wan2-net', 'lan-net', 'int-mgmt-net']
+# The list of named objects within the facts sections that hold them
+NFVIS_FACTS_OBJECTS = {'deployments': 'deployment', 'bridges': 'bridge', 'networks': 'network'}
+
+
+def _fetch_url_accepts(name):
+    """Whether the installed fetch_url() takes the given keyword argument."""
+    try:
+        if hasattr(inspect, 'signature'):
+            return name in inspect.signature(fetch_url).parameters
+        return name in inspect.getargspec(fetch_url).args
+    except Exception:
+        return False
+
+
+# Ansible 2.14 and later decompress gzip responses in fetch_url() unless told not to
+FETCH_URL_DECOMPRESS = _fetch_url_accepts('decompress')
+
 
 def nfvis_argument_spec():
     return dict(host=dict(type='str', required=True, fallback=(env_fallback, ['NFVIS_HOST'])),
             user=dict(type='str', required=True, fallback=(env_fallback, ['NFVIS_USER'])),
             password=dict(type='str', required=True, fallback=(env_fallback, ['NFVIS_PASSWORD'])),
             validate_certs=dict(type='bool', required=False, default=False),
-            timeout=dict(type='int', default=60)
+            timeout=dict(type='int', default=60),
+            result_detail=dict(type='str', choices=['minimal', 'changes', 'full'], default='full'),
+            metrics=dict(type='bool', default=False),
+            cache_dir=dict(type='path', fallback=(env_fallback, ['NFVIS_CACHE_DIR'])),
+            retries=dict(type='int', default=3),
+            retry_backoff=dict(type='float', default=1.0),
+            max_concurrency=dict(type='int', default=8),
+            lock_dir=dict(type='path', fallback=(env_fallback, ['NFVIS_LOCK_DIR'])),
+            max_host_requests=dict(type='int', default=4)
+    )
+
+
+def nfvis_job_id(job):
+    """The id of an async job, given the id or the registered result of the task that started it.
+
+    Returns None for a result without a job id, e.g. of a skipped task.
+    Raises ValueError for an id that is not an async job id, as the id
+    names a file in the async directory.
+    """
+    if isinstance(job, dict):
+        job = job.get('ansible_job_id')
+    if not isinstance(job, string_types) or not job:
+        return None
+    if not NFVIS_JOB_ID_RE.match(job):
+        raise ValueError('Invalid job id {0}'.format(job))
+    return job
+
+
+def nfvis_job_path(async_dir, job_id):
+    """The file of an async job.  Raises ValueError for an invalid job id, see nfvis_job_id()."""
+    if not isinstance(job_id, string_types) or not NFVIS_JOB_ID_RE.match(job_id):
+        raise ValueError('Invalid job id {0}'.format(job_id))
+    return os.path.join(os.path.expanduser(async_dir), job_id)
+
+
+def nfvis_job_status(async_dir, job_id):
+    """Read an async job: its state ('running', 'finished', 'failed' or 'unknown') and result.
+
+    Ansible's async wrapper keeps {started, finished} in the job file while
+    the module runs and replaces it with the module's result once it exits,
+    so a job file without 'started' holds the result.
+    """
+    path = nfvis_job_path(async_dir, job_id)
+    job = dict(job_id=job_id, results_file=path)
+    try:
+        with open(path) as f:
+            data = json.loads(f.read())
+    except (IOError, OSError):
+        job.update(state='unknown', msg='No job {0} in {1}'.format(job_id, async_dir))
+        return job
+    except ValueError:
+        # Not written yet
+        data = dict(started=True)
+    if not isinstance(data, dict):
+        job.update(state='failed', msg='Could not parse the result of job {0}'.format(job_id))
+    elif 'started' in data and not data.get('finished'):
+        job.update(state='running', seconds=round(time.time() - os.path.getmtime(path), 3))
+    else:
+        job.update(state='failed' if data.get('failed') else 'finished', result=data)
+    return job
+
+
+def nfvis_job_cleanup(async_dir, job_id):
+    """Delete the file of an async job."""
+    path = nfvis_job_path(async_dir, job_id)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def nfvis_facts_section(response, key):
+    """Extract one facts section from its API response, or [] if the host does not have it."""
+    if isinstance(response, dict) and key in response:
+        return response[key]
+    return []
+
+
+def nfvis_facts_objects(name, section):
+    """The objects of a facts section hashed by name.  Sections without named objects are one object."""
+    if name not in NFVIS_FACTS_OBJECTS:
+        return {name: section}
+    items = section.get(NFVIS_FACTS_OBJECTS[name], []) if isinstance(section, dict) else []
+    if isinstance(items, dict):
+        items = [items]
+    return dict((item['name'], item) for item in items if isinstance(item, dict) and 'name' in item)
+
+
+def nfvis_as_list(value):
+    """YANG JSON returns one element lists as the element itself; always return a list."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def nfvis_facts_index(facts):
+    """Name-keyed maps of the deployments, bridges and networks, and the reverse indexes between them."""
+    index = dict()
+    for name in NFVIS_FACTS_OBJECTS:
+        index[name] = nfvis_facts_objects(name, facts.get(name))
+    index.update(network_bridge=dict(), bridge_networks=dict(), bridge_ports=dict(),
+                 deployment_networks=dict(), network_deployments=dict())
+
+    for name, bridge in index['bridges'].items():
+        index['bridge_networks'][name] = []
+        index['bridge_ports'][name] = [port['name'] for port in nfvis_as_list(bridge.get('port'))
+                                       if isinstance(port, dict) and 'name' in port]
+    for name, network in index['networks'].items():
+        index['network_deployments'][name] = []
+        if network.get('bridge'):
+            index['network_bridge'][name] = network['bridge']
+            index['bridge_networks'].setdefault(network['bridge'], []).append(name)
+    for name, deployment in index['deployments'].items():
+        networks = nfvis_deployment_networks(deployment)
+        index['deployment_networks'][name] = networks
+        for network in networks:
+            index['network_deployments'].setdefault(network, []).append(name)
+    return index
+
+
+def nfvis_find(value, predicate):
+    """Whether predicate(d) holds for value, if it is a dict, or any dict nested in it."""
+    if isinstance(value, dict):
+        if predicate(value):
+            return True
+        value = list(value.values())
+    if isinstance(value, list):
+        return any(nfvis_find(item, predicate) for item in value)
+    return False
+
+
+def nfvis_event_matches(data, deployment, events=None):
+    """Whether the data of a notification, in JSON or XML, reports one of events for a deployment."""
+    events = events or NFVIS_ALIVE_EVENTS
+    try:
+        value = json.loads(data)
+    except ValueError:
+        # Collect the leaves of the XML by their local name
+        value = dict()
+        for name, text in re.findall(r'<(?:[\w.-]+:)?([\w.-]+)(?:\s[^>]*)?>([^<]*)</', data):
+            value.setdefault(name, []).append(text.strip())
+        return (deployment in value.get('deployment', []) + value.get('deployment_name', []) and
+                any(event in value.get(key, []) for key in ['status', 'event', 'event_name'] for event in events))
+
+    def matches(item):
+        names = [item.get(key) for key in ['deployment', 'deployment_name', 'deployment-name']]
+        return deployment in names and any(item.get(key) in events for key in ['status', 'event', 'event_name', 'event-name'])
+    return nfvis_find(value, matches)
+
+
+def nfvis_opdata_deployment_names(opdata):
+    """The names of the deployments listed in the operational data of a tenant's deployments."""
+    section = nfvis_facts_section(opdata, 'vmlc:deployments')
+    return set(item.get('deployment_name', item.get('name'))
+               for item in nfvis_as_list(section.get('deployment') if isinstance(section, dict) else None)
+               if isinstance(item, dict))
+
+
+def nfvis_deployment_alive(opdata, deployment):
+    """Whether the operational data of a tenant's deployments reports that a deployment has booted."""
+    section = nfvis_facts_section(opdata, 'vmlc:deployments')
+    for item in nfvis_as_list(section.get('deployment') if isinstance(section, dict) else None):
+        if isinstance(item, dict) and item.get('deployment_name', item.get('name')) == deployment:
+            return nfvis_find(item, lambda value: any(state in nfvis_as_list(value.get('state')) for state in NFVIS_ALIVE_STATES))
+    return False
+
+
+def nfvis_image_delete_requests(image):
+    """The requests that delete an image and then its uploaded file, given the image from the images list."""
+    requests = [('DELETE', '/config/vm_lifecycle/images/image/{0}'.format(image['name']), None)]
+    src = image.get('src') or ''
+    if '://' in src:
+        requests.append(('POST', '/operations/system/file-delete/file', json.dumps({'input': {'name': src.split('://')[1]}})))
+    return requests
+
+
+def nfvis_deployment_networks(deployment):
+    """The names of the networks that the interfaces of a deployment are attached to."""
+    networks = []
+    for vm_group in nfvis_as_list(deployment.get('vm_group') if isinstance(deployment, dict) else None):
+        interfaces = vm_group.get('interfaces') if isinstance(vm_group, dict) else None
+        if isinstance(interfaces, dict):
+            interfaces = interfaces.get('interface')
+        for interface in nfvis_as_list(interfaces):
+            if isinstance(interface, dict) and 'interface' in interface:
+                interface = interface['interface']
+            if isinstance(interface, dict) and interface.get('network') and interface['network'] not in networks:
+                networks.append(interface['network'])
+    return networks
+
+
+def nfvis_deployment_images(deployment):
+    """The names of the images used by the VM groups of a deployment."""
+    images = []
+    for vm_group in nfvis_as_list(deployment.get('vm_group') if isinstance(deployment, dict) else None):
+        if isinstance(vm_group, dict) and vm_group.get('image') and vm_group['image'] not in images:
+            images.append(vm_group['image'])
+    return images
+
+
+def nfvis_facts_section_digest(name, section):
+    """The hash of a facts section and of every object in it."""
+    objects = dict((object_name, nfvis_fingerprint(value))
+                   for object_name, value in nfvis_facts_objects(name, section).items())
+    return dict(hash=nfvis_fingerprint(section), objects=objects)
+
+
+def nfvis_facts_section_changes(name, before, section, value):
+    """The objects of a section added, removed or modified since its previous digest, or None if it did not change."""
+    if before.get('hash') == section.get('hash'):
+        return None
+    objects = nfvis_facts_objects(name, value)
+    old_objects = before.get('objects', dict())
+    new_objects = section.get('objects', dict())
+    return dict(
+        added=[objects[key] for key in sorted(new_objects) if key not in old_objects],
+        removed=[key for key in sorted(old_objects) if key not in new_objects],
+        modified=[objects[key] for key in sorted(new_objects)
+                  if key in old_objects and old_objects[key] != new_objects[key]],
     )
 
 
+def nfvis_facts_digest(facts, tenant_deployments=None):
+    """A compact digest of the facts: the hash of every section and of every object in it.
+
+    The deployments of every tenant in tenant_deployments are digested as
+    sections of their own under 'tenant_deployments'.
+    """
+    digest = dict()
+    for name, url_path, key in NFVIS_FACTS_SECTIONS:
+        if name not in facts:
+            continue
+        digest[name] = nfvis_facts_section_digest(name, facts[name])
+    if tenant_deployments is not None:
+        digest['tenant_deployments'] = dict((tenant, nfvis_facts_section_digest('deployments', section))
+                                            for tenant, section in tenant_deployments.items())
+    return digest
+
+
+def nfvis_facts_changes(previous, digest, facts, tenant_deployments=None):
+    """The objects added, removed or modified since the previous digest, for the sections that changed."""
+    changes = dict()
+    for name, section in digest.items():
+        if name == 'tenant_deployments':
+            continue
+        section_changes = nfvis_facts_section_changes(name, previous.get(name, dict()), section, facts[name])
+        if section_changes is not None:
+            changes[name] = section_changes
+    if tenant_deployments is not None:
+        before = previous.get('tenant_deployments', dict())
+        after = digest.get('tenant_deployments', dict())
+        tenant_changes = dict()
+        # A tenant that is gone has all of its deployments removed
+        for tenant in sorted(set(before) | set(after)):
+            section_changes = nfvis_facts_section_changes('deployments', before.get(tenant, dict()),
+                                                          after.get(tenant, dict()), tenant_deployments.get(tenant))
+            if section_changes is not None:
+                tenant_changes[tenant] = section_changes
+        if tenant_changes:
+            changes['tenant_deployments'] = tenant_changes
+    return changes
+
+
+def nfvis_summarize(value):
+    """Replace a payload with its SHA-1 and size in bytes."""
+    if not isinstance(value, (string_types, binary_type)):
+        value = json.dumps(value, sort_keys=True)
+    value = to_bytes(value)
+    return dict(sha1=hashlib.sha1(value).hexdigest(), size=len(value))
+
+
+def nfvis_size_bytes(value):
+    """Convert a human readable size such as '4.0K', '1.2G' or '512 MB' to bytes, or None if it cannot be parsed."""
+    if isinstance(value, int):
+        return value
+    match = re.match(r'^\s*([0-9]*\.?[0-9]+)\s*([KMGTP]?)(?:I?B)?\s*$', to_text(value or '').upper())
+    if not match:
+        return None
+    return int(float(match.group(1)) * NFVIS_SIZE_UNITS[match.group(2)])
+
+
+def nfvis_file_entry(item):
+    """Normalize an entry of the datastore file list, with the size in bytes."""
+    name = to_text(item.get('name', ''))
+    directory = to_text(item.get('path', ''))
+    if directory and not name.startswith('/'):
+        name = '{0}/{1}'.format(directory.rstrip('/'), name)
+    return dict(path=name, directory=os.path.dirname(name), size=nfvis_size_bytes(item.get('size')),
+                type=item.get('type'), modified=item.get('date-modified'))
+
+
+def nfvis_disk_space(response):
+    """The disks in a disk-space response, each with its name, mount point and available bytes."""
+    section = nfvis_facts_section(response, 'system:disk-space')
+    disks = []
+    for item in nfvis_as_list(section.get('disk-size') if isinstance(section, dict) else None):
+        if not isinstance(item, dict):
+            continue
+        name = item.get('name') or item.get('disk-name')
+        available = None
+        for key in ['available', 'disk-available', 'avail']:
+            if key in item:
+                available = nfvis_size_bytes(item[key])
+                break
+        disks.append(dict(name=name, mount=item.get('mounted-on') or NFVIS_DISK_MOUNTS.get(name), available=available))
+    return disks
+
+
+def nfvis_disk_for_path(disks, path):
+    """The disk holding path, i.e. the one with the longest mount point that contains it, or None."""
+    found = None
+    for disk in disks:
+        mount = (disk['mount'] or '').rstrip('/')
+        if disk['mount'] and (path == mount or path.startswith(mount + '/')):
+            if found is None or len(mount) > len(found['mount'].rstrip('/')):
+                found = disk
+    return found
+
+
+class _Absent(object):
+    """Marker for leaves that must not exist on the NFVIS host."""
+
+    def __repr__(self):
+        return 'NFVIS_ABSENT'
+
+
+NFVIS_ABSENT = _Absent()
+
+
+def nfvis_normalize(value):
+    """Reduce a value to a canonical form so that YANG JSON compares equal to module params.
+
+    Scalars become strings (booleans as 'true'/'false'), single element lists
+    collapse to their element and lists are sorted, so that a vlan of 100,
+    '100' and ['100'] all normalize to '100'.  A list of single key wrappers
+    such as [{'interface': a}, {'interface': b}] becomes {'interface': [a, b]},
+    the form NFVIS returns.
+    """
+    if isinstance(value, dict):
+        return dict((k, nfvis_normalize(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) and len(item) == 1 for item in value):
+            keys = set(list(item)[0] for item in value)
+            if len(keys) == 1:
+                key = keys.pop()
+                return {key: nfvis_normalize([item[key] for item in value])}
+        items = [nfvis_normalize(item) for item in value]
+        if len(items) == 1:
+            return items[0]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return None
+    return to_text(value)
+
+
+def nfvis_project(current, desired):
+    """Restrict normalized current data to the keys present in normalized desired data."""
+    if isinstance(desired, dict) and isinstance(current, dict):
+        return dict((k, nfvis_project(current[k], v)) for k, v in desired.items() if k in current)
+    if isinstance(current, list):
+        template = desired
+        if isinstance(desired, list):
+            # Project every element onto the union of the desired elements
+            template = dict()
+            for item in desired:
+                if isinstance(item, dict):
+                    template.update(item)
+        if isinstance(template, dict):
+            return nfvis_normalize([nfvis_project(item, template) for item in current])
+    return current
+
+
+def nfvis_fingerprint(value):
+    """Compact, order independent hash of the normalized form of value."""
+    canonical = json.dumps(nfvis_normalize(value), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(to_bytes(canonical)).hexdigest()
+
+
+def nfvis_diff(desired, current, path=(), merge_keys=None):
+    """Compute the changes needed to bring the current YANG JSON in line with the desired state.
+
+    Only leaves present in desired are considered: None means "don't care" and
+    NFVIS_ABSENT means the leaf must be removed.  Lists whose dotted path is in
+    merge_keys are merged on the given key field instead of being replaced.
+    Returns a list of dicts with an op (add, replace, merge or remove), the
+    path as a list of keys, and the old and/or new value.
+    """
+    if merge_keys is None:
+        merge_keys = dict()
+    if not isinstance(current, dict):
+        current = dict()
+    changes = []
+    for key, want in desired.items():
+        if want is None:
+            continue
+        sub = list(path) + [key]
+        if want is NFVIS_ABSENT:
+            if key in current:
+                changes.append(dict(op='remove', path=sub, old=current[key]))
+            continue
+        if key not in current:
+            changes.append(dict(op='add', path=sub, new=want))
+            continue
+        have = current[key]
+        if isinstance(want, dict) and isinstance(have, dict):
+            changes.extend(nfvis_diff(want, have, sub, merge_keys))
+        elif '.'.join(sub) in merge_keys:
+            field = merge_keys['.'.join(sub)]
+            if not isinstance(have, list):
+                have = [have]
+            existing = set(nfvis_normalize(item.get(field)) for item in have if isinstance(item, dict))
+            missing = [item for item in want if nfvis_normalize(item.get(field)) not in existing]
+            if missing:
+                changes.append(dict(op='merge', path=sub, old=current[key], new=missing))
+        elif nfvis_normalize(want) != nfvis_normalize(have):
+            changes.append(dict(op='replace', path=sub, old=have, new=want))
+    return changes
+
+
+def nfvis_apply_changes(obj, changes):
+    """Return a copy of obj with the change set from nfvis_diff applied."""
+    obj = copy.deepcopy(obj)
+    for change in changes:
+        parent = obj
+        for key in change['path'][:-1]:
+            parent = parent.setdefault(key, dict())
+        key = change['path'][-1]
+        if change['op'] == 'remove':
+            parent.pop(key, None)
+        elif change['op'] == 'merge':
+            existing = parent.get(key)
+            if existing is None:
+                existing = []
+            elif not isinstance(existing, list):
+                existing = [existing]
+            parent[key] = existing + copy.deepcopy(change['new'])
+        else:
+            parent[key] = copy.deepcopy(change['new'])
+    return obj
+
+
+def nfvis_changed_fields(changes, depth=1):
+    """Names of the changed leaves, relative to the object root, for what_changed."""
+    fields = []
+    for change in changes:
+        field = '.'.join(to_text(key) for key in change['path'][depth:])
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+
+def nfvis_ranges(value, minimum=1, maximum=4094):
+    """Parse IDs such as '100-199,300', 300 or [300, '400-410'] into sorted, merged [start, end] intervals."""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = to_text(value).split(',')
+    intervals = []
+    for item in value:
+        item = to_text(item).strip()
+        if not item:
+            continue
+        start, sep, end = item.partition('-')
+        try:
+            start = int(start)
+            end = int(end) if sep else start
+        except ValueError:
+            raise ValueError('Invalid range {0!r}'.format(item))
+        if start > end or start < minimum or end > maximum:
+            raise ValueError('Invalid range {0!r}, IDs must be from {1} to {2}'.format(item, minimum, maximum))
+        intervals.append([start, end])
+    return nfvis_ranges_merge(intervals)
+
+
+def nfvis_ranges_merge(intervals):
+    """Sort intervals and merge the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def nfvis_ranges_from_ids(ids):
+    """The intervals covering a collection of IDs."""
+    return nfvis_ranges_merge([[i, i] for i in ids])
+
+
+def nfvis_ranges_subtract(intervals, other):
+    """The parts of intervals that are not in other.  Both must be merged; runs in O(len(intervals) + len(other))."""
+    result = []
+    j = 0
+    for start, end in intervals:
+        while j < len(other) and other[j][1] < start:
+            j += 1
+        k = j
+        while k < len(other) and other[k][0] <= end:
+            if other[k][0] > start:
+                result.append([start, other[k][0] - 1])
+            start = max(start, other[k][1] + 1)
+            k += 1
+        if start <= end:
+            result.append([start, end])
+    return result
+
+
+def nfvis_ranges_intersect(intervals, other):
+    """The parts of intervals that are also in other.  Both must be merged; runs in O(len(intervals) + len(other))."""
+    result = []
+    i = j = 0
+    while i < len(intervals) and j < len(other):
+        start = max(intervals[i][0], other[j][0])
+        end = min(intervals[i][1], other[j][1])
+        if start <= end:
+            result.append([start, end])
+        if intervals[i][1] < other[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def nfvis_ranges_ids(intervals):
+    """Every ID in the intervals."""
+    for start, end in intervals:
+        for i in range(start, end + 1):
+            yield i
+
+
+def nfvis_ranges_format(intervals):
+    """Format intervals as a range string such as '100-199,300'."""
+    return ','.join(str(start) if start == end else '{0}-{1}'.format(start, end) for start, end in intervals)
+
+
+def nfvis_update_requests(url_path, current, changes):
+    """The requests that push a change set from nfvis_diff to the object at url_path, see nfvisModule.update().
+
+    Returns the (method, path, payload) requests and the full PUT payload that they replace.
+    """
+    full_payload = json.dumps(nfvis_apply_changes(current, changes))
+    merge = dict()
+    requests = []
+    for change in changes:
+        path = change['path']
+        if change['op'] == 'remove':
+            requests.append(('DELETE', '/'.join([url_path] + path[1:]), None))
+        elif change['op'] == 'replace' and (isinstance(change['old'], list) or isinstance(change['new'], list)):
+            if len(path) < 3:
+                merge = None
+                requests = [('PUT', url_path, full_payload)]
+                break
+            container = path[:-1]
+            body = {container[-1]: {path[-1]: change['new']}}
+            requests.append(('PUT', '/'.join([url_path] + container[1:]), json.dumps(body)))
+        else:
+            parent = merge
+            for key in path[:-1]:
+                parent = parent.setdefault(key, dict())
+            parent[path[-1]] = change['new']
+    if merge:
+        requests.insert(0, ('PATCH', url_path, json.dumps(merge)))
+    return requests, full_payload
+
+
+def nfvis_system_spec():
+    """The options of nfvis_system, also the suboptions of system in nfvis_config."""
+    return dict(hostname=dict(type='str', required=True),
+                trusted_source=dict(type='list'),
+                dpdk=dict(type='bool'),
+                mgmt=dict(type='str', required=True),
+                default_gw=dict(type='str'),
+                )
+
+
+def nfvis_system_desired(params):
+    """The desired system settings for nfvis_diff.  Raises ValueError on invalid params."""
+    desired = {'settings': {}}
+    if params['hostname']:
+        desired['settings']['hostname'] = params['hostname'].split('.')[0]
+    if params['trusted_source']:
+        ip_receive_acl = []
+        for network in params['trusted_source']:
+            ip_receive_acl.append({'source': network, 'action': 'accept', 'priority': 0, 'service': ['https', 'icmp', 'netconf', 'scpd', 'snmp', 'ssh']})
+        desired['settings']['ip-receive-acls'] = {'ip-receive-acl': ip_receive_acl}
+    if params['dpdk'] is not None:
+        desired['settings']['dpdk'] = ['disable', 'enable'][params['dpdk'] == True]
+    if params['mgmt'] == 'dhcp':
+        desired['settings']['mgmt'] = {'dhcp': [None]}
+    else:
+        # Make sure that we have a righteous mgmt IP address
+        if not HAS_NETADDR:
+            raise ValueError('Could not import the python library netaddr required for a static mgmt address')
+        try:
+            mgmt_ip = netaddr.IPNetwork(params['mgmt'])
+        except (ValueError, netaddr.AddrFormatError):
+            raise ValueError('mgmt address/netmask is invalid: {0}'.format(params['mgmt']))
+        desired['settings']['mgmt'] = {'ip': {'address': str(mgmt_ip.ip), 'netmask': str(mgmt_ip.netmask)}}
+    desired['settings']['default-gw'] = params['default_gw']
+    return desired
+
+
+def nfvis_bridge_spec():
+    """The options of nfvis_bridge, also the suboptions of the bridges in nfvis_config."""
+    return dict(state=dict(type='str', choices=['absent', 'present'], default='present'),
+                name=dict(type='str', aliases=['bridge']),
+                ports=dict(type='list'),
+                ip=dict(type='dict'),
+                vlan=dict(type='int'),
+                purge=dict(type='bool', default=False),
+                dhcp=dict(type='bool'),
+                )
+
+
+def _nfvis_bridge_ip(params):
+    if 'address' not in params['ip']:
+        raise ValueError('address must be specified for ip')
+    if 'netmask' not in params['ip']:
+        raise ValueError('netmask must be specified for ip')
+    return {'address': params['ip']['address'], 'netmask': params['ip']['netmask']}
+
+
+def nfvis_bridge_payload(params):
+    """The payload that creates a bridge, or replaces it with purge.  Raises ValueError on invalid params."""
+    payload = {'bridge': {}}
+    payload['bridge']['name'] = params['name']
+    if params['dhcp'] == True:
+        payload['bridge']['dhcp'] = [None]
+    payload['bridge']['port'] = [{'name': port} for port in params['ports'] or []]
+    if params['vlan']:
+        payload['bridge']['vlan'] = params['vlan']
+    if params['ip']:
+        payload['bridge']['ip'] = _nfvis_bridge_ip(params)
+    return payload
+
+
+def nfvis_bridge_desired(params):
+    """The desired state of an existing bridge for nfvis_diff with NFVIS_BRIDGE_MERGE_KEYS.  Raises ValueError on invalid params."""
+    desired = {'bridge': {}}
+    if params['ports']:
+        desired['bridge']['port'] = [{'name': port} for port in params['ports']]
+    desired['bridge']['vlan'] = params['vlan']
+    if params['dhcp'] == True:
+        desired['bridge']['dhcp'] = [None]
+    elif params['dhcp'] == False:
+        desired['bridge']['dhcp'] = NFVIS_ABSENT
+    if params['ip']:
+        desired['bridge']['ip'] = _nfvis_bridge_ip(params)
+    return desired
+
+
+def nfvis_network_spec():
+    """The options of nfvis_network, also the suboptions of the networks in nfvis_config."""
+    return dict(state=dict(type='str', choices=['absent', 'present'], default='present'),
+                name=dict(type='str', required=True, aliases=['network']),
+                bridge=dict(type='str'),
+                trunk=dict(type='bool', default=True),
+                sriov=dict(type='bool', default=False),
+                native_tagged=dict(type='bool'),
+                native_vlan=dict(type='str'),
+                vlan=dict(type='int'),
+                )
+
+
+def nfvis_network_desired(params):
+    """The desired state of a network for nfvis_diff."""
+    desired = {'network': {}}
+    desired['network']['bridge'] = params['bridge']
+    if params['trunk'] == False:
+        desired['network']['trunk'] = params['trunk']
+        if params['vlan']:
+            desired['network']['vlan'] = params['vlan']
+    if params['sriov']:
+        desired['network']['sriov'] = params['sriov']
+    if params['native_tagged']:
+        desired['network']['native-tagged'] = params['native_tagged']
+    if params['native_vlan']:
+        desired['network']['native-vlan'] = params['native_vlan']
+    return desired
+
+
+def nfvis_network_payload(params):
+    """The payload that creates a network.  Raises ValueError on invalid params."""
+    if not params['bridge']:
+        raise ValueError('bridge must be specified when state is present')
+    payload = {'network': {'name': params['name']}}
+    payload['network'].update(nfvis_network_desired(params)['network'])
+    return payload
+
+
+def nfvis_deployment_spec():
+    """The options of nfvis_deployment, also the suboptions of the deployments in nfvis_config."""
+    return dict(state=dict(type='str', choices=['absent', 'present'], default='present'),
+                name=dict(type='str', aliases=['deployment']),
+                image=dict(type='str'),
+                flavor=dict(type='str'),
+                bootup_time=dict(type='int', default=-1),
+                recovery_wait_time=dict(type='int', default=0),
+                kpi_data=dict(type='bool', default=False),
+                scaling=dict(type='bool', default=False),
+                scaling_min_active=dict(type='int', default=1),
+                scaling_max_active=dict(type='int', default=1),
+                placement_type=dict(type='str', default='zone_host'),
+                placement_enforcement=dict(type='str', default='strict'),
+                placement_host=dict(type='str', default='datastore1'),
+                recovery_type=dict(type='str', default='AUTO'),
+                action_on_recovery=dict(type='str', default='REBOOT_ONLY'),
+                interfaces=dict(type='list'),
+                port_forwarding=dict(type='list'),
+                config_data=dict(type='list'),
+                tenant=dict(type='str', default='admin'),
+                allow_recreate=dict(type='bool', default=False),
+                wait_timeout=dict(type='int', default=300),
+                )
+
+
+def nfvis_deployment_payload(params):
+    """The payload that creates a deployment.  Raises ValueError on invalid params."""
+    payload = {'deployment': {}}
+    payload['deployment']['name'] = params['name']
+    payload['deployment']['vm_group'] = {}
+    payload['deployment']['vm_group']['name'] = params['name']
+    if params['image']:
+        payload['deployment']['vm_group']['image'] = params['image']
+    else:
+        raise ValueError('image must be specified when state is present')
+    if params['flavor']:
+        payload['deployment']['vm_group']['flavor'] = params['flavor']
+    else:
+        raise ValueError('flavor must be specified when state is present')
+    payload['deployment']['vm_group']['bootup_time'] = params['bootup_time']
+    payload['deployment']['vm_group']['recovery_wait_time'] = params['recovery_wait_time']
+    payload['deployment']['vm_group']['kpi_data'] = {}
+    payload['deployment']['vm_group']['kpi_data']['enabled'] = params['kpi_data']
+    payload['deployment']['vm_group']['scaling'] = {}
+    payload['deployment']['vm_group']['scaling']['min_active'] = params['scaling_min_active']
+    payload['deployment']['vm_group']['scaling']['max_active'] = params['scaling_max_active']
+    payload['deployment']['vm_group']['scaling']['elastic'] = params['scaling']
+    payload['deployment']['vm_group']['placement'] = {}
+    payload['deployment']['vm_group']['placement']['type'] = params['placement_type']
+    payload['deployment']['vm_group']['placement']['enforcement'] = params['placement_enforcement']
+    payload['deployment']['vm_group']['placement']['host'] = params['placement_host']
+    payload['deployment']['vm_group']['recovery_policy'] = {}
+    payload['deployment']['vm_group']['recovery_policy']['recovery_type'] = params['recovery_type']
+    payload['deployment']['vm_group']['recovery_policy']['action_on_recovery'] = params['action_on_recovery']
+
+    port_forwarding = {}
+    if params['port_forwarding']:
+        for item in params['port_forwarding']:
+            port_forwarding['port'] = {}
+            port_forwarding['port']['type'] = item.get('type', 'ssh')
+            port_forwarding['port']['vnf_port'] = item.get('vnf_port', 22)
+            port_forwarding['port']['external_port_range'] = {}
+            if 'proxy_port' in item:
+                port_forwarding['port']['external_port_range']['start'] = item['proxy_port']
+                port_forwarding['port']['external_port_range']['end'] = item['proxy_port']
+            else:
+                raise ValueError('proxy_port must be specified for port_forwarding')
+            port_forwarding['port']['protocol'] = item.get('protocol', 'tcp')
+            port_forwarding['port']['source_bridge'] = item.get('source_bridge', 'MGMT')
+
+    if params['interfaces']:
+        payload['deployment']['vm_group']['interfaces'] = []
+        for index, item in enumerate(params['interfaces']):
+            entry = {}
+            entry['interface'] = {}
+            entry['interface']['nicid'] = item.get('nicid', index)
+            if 'network' in item:
+                entry['interface']['network'] = item['network']
+            else:
+                raise ValueError('network must be specified for interface')
+            if 'model' in item:
+                entry['interface']['model'] = item['model']
+            if index == 0 and 'port' in port_forwarding:
+                entry['interface']['port_forwarding'] = port_forwarding
+            payload['deployment']['vm_group']['interfaces'].append(entry)
+
+    if params['config_data']:
+        payload['deployment']['vm_group']['config_data'] = []
+        for item in params['config_data']:
+            entry = {'configuration': {}}
+            if 'dst' in item:
+                entry['configuration']['dst'] = item['dst']
+            else:
+                raise ValueError('dst must be specified for config_data')
+            if 'data' in item:
+                if isinstance(item['data'], str):
+                    entry['configuration']['data'] = item['data']
+                else:
+                    entry['configuration']['data'] = json.dumps(item['data'])
+            else:
+                raise ValueError('data must be specified for config_data')
+            payload['deployment']['vm_group']['config_data'].append(entry)
+
+    if params['kpi_data'] == True or params['bootup_time'] > 0:
+        payload['deployment']['vm_group']['kpi_data']['kpi'] = {}
+        payload['deployment']['vm_group']['kpi_data']['kpi']['event_name'] = 'VM_ALIVE'
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_value'] = 1
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_cond'] = 'GT'
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_type'] = 'UINT32'
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector'] = {}
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['type'] = 'ICMPPing'
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['nicid'] = 0
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['poll_frequency'] = 3
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['polling_unit'] = 'seconds'
+        payload['deployment']['vm_group']['kpi_data']['kpi']['metric_collector']['continuous_alarm'] = False
+        payload['deployment']['vm_group']['rules'] = {}
+        payload['deployment']['vm_group']['rules']['admin_rules'] = {}
+        payload['deployment']['vm_group']['rules']['admin_rules']['rule'] = {}
+        payload['deployment']['vm_group']['rules']['admin_rules']['rule']['event_name'] = 'VM_ALIVE'
+        payload['deployment']['vm_group']['rules']['admin_rules']['rule']['action'] = ["ALWAYS log", "FALSE recover autohealing", "TRUE servicebooted.sh"]
+    return payload
+
+
+def nfvis_deployment_vm_group(payload, current):
+    """The normalized vm_group of a deployment on the host that the payload's vm_group manages.
+
+    A deployment with several vm_groups is matched by the name of the
+    payload's vm_group.  Raises ValueError if none of them has that name.
+    """
+    name = payload['deployment']['vm_group']['name']
+    vm_groups = nfvis_as_list(nfvis_normalize(current.get('vm_group', {})))
+    if len(vm_groups) == 1 and isinstance(vm_groups[0], dict):
+        return vm_groups[0]
+    for vm_group in vm_groups:
+        if isinstance(vm_group, dict) and vm_group.get('name') == name:
+            return vm_group
+    raise ValueError('Deployment {0} has {1} vm_groups and none of them is named {2}'.format(
+        payload['deployment']['name'], len(vm_groups), name))
+
+
+def nfvis_deployment_drift(payload, current):
+    """Compare the settings that define a deployment with the deployment on the host.
+
+    Returns the fingerprints of the desired and current settings and the
+    settings that differ, see NFVIS_DEPLOYMENT_FINGERPRINT_KEYS.  Without a
+    current deployment, the current fingerprint is None and every setting differs.
+    Raises ValueError, see nfvis_deployment_vm_group().
+    """
+    desired = nfvis_normalize(dict((key, value) for key, value in payload['deployment']['vm_group'].items()
+                                   if key in NFVIS_DEPLOYMENT_FINGERPRINT_KEYS))
+    if current is None:
+        return nfvis_fingerprint(desired), None, sorted(desired)
+    current = nfvis_project(nfvis_deployment_vm_group(payload, current), desired)
+    what_changed = [key for key in desired if nfvis_fingerprint(desired[key]) != nfvis_fingerprint(current.get(key))]
+    return nfvis_fingerprint(desired), nfvis_fingerprint(current), what_changed
+
+
+def nfvis_deployment_update_requests(deployment_path, payload, current, what_changed):
+    """The requests that update the mutable settings in what_changed through the vm_group sub-resources."""
+    vm_group = nfvis_deployment_vm_group(payload, current)
+    vm_group_path = '{0}/vm_group/{1}'.format(deployment_path, vm_group.get('name', payload['deployment']['name']))
+    requests = []
+    for key in what_changed:
+        value = payload['deployment']['vm_group'][key]
+        if key == 'interfaces':
+            value = {'interface': [entry['interface'] for entry in value]}
+        requests.append(('PUT', '{0}/{1}'.format(vm_group_path, key), json.dumps({key: value})))
+    return requests
+
+
+def nfvis_topological_order(dependencies):
+    """Order indexes so that each comes after the indexes in its dependencies[index].  Raises ValueError on a cycle."""
+    order = []
+    state = dict()
+    for root in range(len(dependencies)):
+        stack = [(root, iter(sorted(dependencies[root])))]
+        if root in state:
+            continue
+        state[root] = 'visiting'
+        while stack:
+            index, children = stack[-1]
+            for child in children:
+                if state.get(child) == 'visiting':
+                    raise ValueError('Dependency cycle through item {0}'.format(child))
+                if child not in state:
+                    state[child] = 'visiting'
+                    stack.append((child, iter(sorted(dependencies[child]))))
+                    break
+            else:
+                stack.pop()
+                state[index] = 'done'
+                order.append(index)
+    return order
+
+
+def nfvis_step_dependencies(steps):
+    """The indexes of the steps that every step waits for, for nfvisModule.schedule().
+
+    Each step is a dict with the kind and name of its object, its action and
+    uses, the (kind, name) of the objects it refers to: the bridge of a
+    network, the networks and images of a deployment.  Building follows
+    uses, so a network waits for the step on its bridge and a deployment for
+    the steps on its networks and image.  Teardown is the reverse, so a
+    'delete' waits for the deletes of the objects that use it, and for the
+    steps whose object refers to it before they run, given as used: a bridge
+    is only deleted once a network moved off it.  Every other step also waits
+    for the deletes of its own kind, which free names, ports and resources,
+    unless that delete already waits for the step.
+    """
+    index = dict(((step['kind'], step['name']), i) for i, step in enumerate(steps))
+    dependencies = [set() for step in steps]
+    deletes = dict()
+    for i, step in enumerate(steps):
+        if step['action'] == 'delete':
+            deletes.setdefault(step['kind'], set()).add(i)
+    for i, step in enumerate(steps):
+        for used in step.get('uses') or []:
+            j = index.get(tuple(used))
+            if j is None or j == i:
+                continue
+            if step['action'] == 'delete' and steps[j]['action'] == 'delete':
+                # The object this one uses can only go once this one is gone
+                dependencies[j].add(i)
+            elif step['action'] != 'delete' and steps[j]['action'] != 'delete':
+                dependencies[i].add(j)
+        if step['action'] != 'delete':
+            for used in step.get('used') or []:
+                j = index.get(tuple(used))
+                if j is not None and steps[j]['action'] == 'delete':
+                    # The object only goes once this step stopped using it
+                    dependencies[j].add(i)
+
+    def reaches(start, target):
+        seen = set()
+        pending = [start]
+        while pending:
+            current = pending.pop()
+            if current == target:
+                return True
+            if current not in seen:
+                seen.add(current)
+                pending.extend(dependencies[current])
+        return False
+
+    for i, step in enumerate(steps):
+        if step['action'] != 'delete':
+            dependencies[i].update(j for j in deletes.get(step['kind'], set()) if not reaches(j, i))
+    return dependencies
+
+
+class nfvisJSONStream(object):
+    """Incremental JSON reader that yields the items of one list without loading the whole document.
+
+    Only the current item and one read buffer are held in memory, so large
+    ?deep responses can be indexed with bounded memory.
+    """
+
+    WHITESPACE = ' \t\n\r'
+    NUMBER_START = '-0123456789'
+    NUMBER_CHARS = '0123456789+-.eE'
+
+    def __init__(self, fp, chunk_size=65536):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self.fp.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk or b'', final=self.eof)
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character, or '' at the end of the document."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _next(self, expected):
+        c = self._peek()
+        if c not in expected:
+            raise ValueError('Expected one of {0!r} at offset {1}, found {2!r}'.format(expected, self.pos, c))
+        self.pos += 1
+        return c
+
+    def _value(self):
+        """Decode the complete JSON value at the current position.
+
+        A value that is not complete yet is decoded again after the next read,
+        and every read is at least as large as the part already buffered, so
+        a large item (e.g. inline config_data) is decoded in linear time
+        however many reads it spans.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self._fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if not self.eof and self.buf[self.pos] in self.NUMBER_START:
+                rest = self.buf[end:].lstrip(self.NUMBER_CHARS)
+                if not rest:
+                    self._fill()
+                    continue
+            self.pos = end
+            return value
+
+    def items(self, path):
+        """Yield the items of the list found by following the keys in path.
+
+        A single object where a list is expected (as YANG JSON returns for one
+        element lists) is yielded on its own.
+        """
+        c = self._peek()
+        if c == '':
+            return
+        if not path:
+            if c == '[':
+                self.pos += 1
+                if self._peek() == ']':
+                    self.pos += 1
+                    return
+                while True:
+                    yield self._value()
+                    if self._next(',]') == ']':
+                        return
+            else:
+                value = self._value()
+                if value is not None:
+                    yield value
+            return
+        if c != '{':
+            self._value()
+            return
+        self.pos += 1
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._next(':')
+            if key == path[0]:
+                for item in self.items(path[1:]):
+                    yield item
+                return
+            self._value()
+            if self._next(',}') == '}':
+                return
+
+
+class nfvisDecodedReader(object):
+    """File-like wrapper that decompresses a gzip or deflate response body as it is read.
+
+    The bytes received and the bytes after decompression are counted in the
+    metrics dict as bytes_wire and bytes.  Bodies that did not come over the
+    network (wire=False) do not count towards bytes_wire.
+    """
+
+    def __init__(self, fp, encoding=None, metrics=None, chunk_size=65536, wire=True):
+        self.fp = fp
+        self.wire = wire
+        self.encoding = encoding or 'identity'
+        self.chunk_size = chunk_size
+        self.metrics = metrics if metrics is not None else dict()
+        self.metrics.update(encoding=self.encoding, bytes_wire=0, bytes=0)
+        self.decompressor = None
+        if self.encoding == 'gzip':
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self.decompressor = zlib.decompressobj()
+        self.buf = b''
+        self.eof = False
+
+    def _decompress(self, chunk):
+        try:
+            return self.decompressor.decompress(chunk)
+        except zlib.error:
+            # Some servers send raw deflate data without the zlib header
+            if self.encoding != 'deflate' or self.metrics['bytes'] or self.buf:
+                raise
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.decompressor.decompress(chunk)
+
+    def read(self, size=-1):
+        while not self.eof and (size is None or size < 0 or len(self.buf) < size):
+            chunk = self.fp.read(self.chunk_size)
+            if not chunk:
+                self.eof = True
+                if self.decompressor is not None:
+                    self.buf += self.decompressor.flush()
+                break
+            if self.wire:
+                self.metrics['bytes_wire'] += len(chunk)
+            if self.decompressor is not None:
+                chunk = self._decompress(chunk)
+            self.buf += chunk
+        if size is None or size < 0:
+            data, self.buf = self.buf, b''
+        else:
+            data, self.buf = self.buf[:size], self.buf[size:]
+        self.metrics['bytes'] += len(data)
+        return data
+
+    def close(self):
+        self.fp.close()
+
+
+class nfvisCache(object):
+    """Local store of GET responses that are revalidated with ETag/Last-Modified.
+
+    Every cached response is a .body file with the decoded response body and a
+    .json file with its validators.  Bodies are written through while the
+    response is read and only become visible once they were read completely,
+    before their validators.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def key(self, host, url_path, headers):
+        return hashlib.sha1(to_bytes('{0} {1} {2}'.format(host, url_path, headers.get('Accept')))).hexdigest()
+
+    def _meta(self, key):
+        try:
+            with open(os.path.join(self.path, key + '.json')) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def conditional_headers(self, key):
+        """Headers that ask the NFVIS host to answer 304 if the cached copy is still current."""
+        headers = dict()
+        meta = self._meta(key)
+        if meta is not None and os.path.exists(os.path.join(self.path, key + '.body')):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last-modified'):
+                headers['If-Modified-Since'] = meta['last-modified']
+        return headers
+
+    def open(self, key):
+        return open(os.path.join(self.path, key + '.body'), 'rb')
+
+    def store(self, key, resp, info):
+        """Wrap resp so that the body is cached as it is read, if the response has validators."""
+        meta = dict((name, info[name]) for name in ['etag', 'last-modified'] if info.get(name))
+        if not meta:
+            return resp
+        return _nfvisCacheWriter(resp, self.path, key, meta)
+
+
+class _nfvisCacheWriter(object):
+    """File-like wrapper that copies a response body into the cache while it is read."""
+
+    def __init__(self, fp, path, key, meta):
+        self.fp = fp
+        self.path = path
+        self.key = key
+        self.meta = meta
+        fd, self.tmp = tempfile.mkstemp(dir=path, prefix='.' + key)
+        self.f = os.fdopen(fd, 'wb')
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        if self.f is None:
+            return data
+        self.f.write(data)
+        if not data or size is None or size < 0:
+            self.f.close()
+            self.f = None
+            # The body goes first: a fork that still reads the old validators
+            # gets a 200 for them, never a 304 that points at an older body
+            os.rename(self.tmp, os.path.join(self.path, self.key + '.body'))
+            fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.' + self.key)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.meta, f)
+            os.rename(tmp, os.path.join(self.path, self.key + '.json'))
+        return data
+
+    def close(self):
+        """Close the response, dropping a body that was not read completely."""
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+            os.remove(self.tmp)
+        self.fp.close()
+
+
+class _nfvisSlotReader(object):
+    """File-like wrapper that holds a request's concurrency slot until the body is read or closed.
+
+    Reading a large ?deep body is the expensive part of a request, so the
+    host semaphore and the adaptive limit are only released at the end of it.
+    """
+
+    def __init__(self, fp, release):
+        self.fp = fp
+        self._release = release
+
+    def read(self, size=-1):
+        try:
+            data = self.fp.read(size)
+        except BaseException:
+            self.close()
+            raise
+        if not data or size is None or size < 0:
+            self.release()
+        return data
+
+    def release(self):
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+    def close(self):
+        try:
+            self.fp.close()
+        finally:
+            self.release()
+
+    def __del__(self):
+        self.release()
+
+
+class nfvisConcurrencyLimit(object):
+    """Adaptive limit on the number of concurrent requests to one NFVIS host.
+
+    The limit grows additively by one request per limit's worth of successful
+    requests and is halved when the host reports it is busy or unreachable
+    (AIMD), so throughput settles at what the host can handle.
+    """
+
+    def __init__(self, maximum, minimum=1):
+        self.maximum = max(maximum, minimum)
+        self.minimum = minimum
+        self.limit = max(float(self.maximum) / 2, minimum)
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, healthy):
+        with self.condition:
+            self.active -= 1
+            if healthy:
+                self.limit = min(self.limit + 1.0 / self.limit, self.maximum)
+            else:
+                self.limit = max(self.limit / 2, self.minimum)
+            self.condition.notify_all()
+
+
+_nfvis_limits = dict()
+_nfvis_limits_lock = threading.Lock()
+
+
+def nfvis_concurrency_limit(host, maximum):
+    """The concurrency limit shared by all requests to host from this process."""
+    with _nfvis_limits_lock:
+        if host not in _nfvis_limits:
+            _nfvis_limits[host] = nfvisConcurrencyLimit(maximum)
+        return _nfvis_limits[host]
+
+
+class nfvisHostSemaphore(object):
+    """Cross-process semaphore capping the concurrent API calls to one NFVIS host.
+
+    Every slot is a lock file under lock_dir and a request holds an exclusive
+    flock on one of them, so the cap applies across all forks and modules
+    that share lock_dir.
+    """
+
+    def __init__(self, lock_dir, host, slots):
+        if not os.path.isdir(lock_dir):
+            os.makedirs(lock_dir)
+        name = re.sub('[^A-Za-z0-9_.-]', '_', host)
+        self.paths = [os.path.join(lock_dir, '{0}.{1}.lock'.format(name, slot)) for slot in range(max(slots, 1))]
+
+    def acquire(self):
+        """Wait for a free slot and return its file descriptor and the seconds waited."""
+        start = time.time()
+        delay = 0.01
+        while True:
+            for path in self.paths:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd, time.time() - start
+                except (IOError, OSError):
+                    os.close(fd)
+            time.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, 0.5)
+
+    def release(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class nfvisCassette(object):
+    """On-disk store of NFVIS request/response pairs for record and replay.
+
+    Each exchange is one compact JSON line keyed by host, method, path and a
+    digest of the payload.  Paths ending in ``.gz`` are written as a stream of
+    gzip members so that concurrent forks can append without rewriting.
+    Replay serves the recorded responses for a key in the order they were
+    recorded, repeating the last one once they run out.
+    """
+
+    def __init__(self, path, mode=None):
+        self.path = path
+        if mode is None:
+            mode = 'replay' if os.path.exists(path) else 'record'
+        if mode not in ['record', 'replay']:
+            raise ValueError('Invalid cassette mode: {0}'.format(mode))
+        self.mode = mode
+        self.entries = None
+        self.played = dict()
+
+    @staticmethod
+    def key(host, method, url_path, payload):
+        digest = ''
+        if payload is not None:
+            digest = hashlib.sha1(to_bytes(payload)).hexdigest()[:16]
+        return '{0} {1} {2} {3}'.format(host, method, url_path, digest)
+
+    def _open(self, mode):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode)
+        return open(self.path, mode)
+
+    def load(self):
+        self.entries = dict()
+        if not os.path.exists(self.path):
+            return self.entries
+        with self._open('rb') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(to_text(line))
+                self.entries.setdefault(entry['k'], []).append(entry)
+        return self.entries
+
+    def play(self, host, method, url_path, payload, url):
+        """Return a recorded (resp, info) pair, or None if there is no match."""
+        if self.entries is None:
+            self.load()
+        key = self.key(host, method, url_path, payload)
+        if key not in self.entries:
+            return None
+        index = self.played.get(key, 0)
+        self.played[key] = index + 1
+        entry = self.entries[key][min(index, len(self.entries[key]) - 1)]
+        body = to_bytes(entry['b']) if entry['b'] is not None else None
+        info = dict(status=entry['s'], msg=entry['m'], url=url)
+        if entry['s'] >= 300 or entry['s'] < 0:
+            info['body'] = body
+            return None, info
+        return io.BytesIO(body or b''), info
+
+    def record(self, host, method, url_path, payload, resp, info):
+        """Append an exchange to the cassette and return an equivalent (resp, info)."""
+        if resp is not None:
+            body = resp.read()
+        else:
+            body = info.get('body')
+        entry = dict(k=self.key(host, method, url_path, payload), s=info['status'], m=info.get('msg'),
+                     b=to_text(body, errors='surrogate_or_strict') if body is not None else None)
+        line = to_bytes(json.dumps(entry, separators=(',', ':'), sort_keys=True)) + b'\n'
+        if self.path.endswith('.gz'):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(line)
+            line = buf.getvalue()
+        # A single O_APPEND write keeps lines from concurrent forks intact
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        if resp is None:
+            return None, info
+        return io.BytesIO(body), info
+
+
+class nfvisError(Exception):
+    """A module failure raised in a worker thread, to be reported from the main thread."""
+
+    def __init__(self, msg, **kwargs):
+        super(nfvisError, self).__init__(msg)
+        self.msg = msg
+        self.kwargs = kwargs
+
+
 class nfvisModule(object):
 
     def __init__(self, module, function=None):
         self.module = module
         self.params = module.params
+        self._local = threading.local()
         self.result = dict(changed=False)
         self.headers = dict()
         self.function = function
@@ -47,53 +1561,482 @@ class nfvisModule(object):
         self.params['url_username'] = self.params['user']
         self.params['url_password'] = self.params['password']
         self.host = self.params['host']
-        self.modifiable_methods = ['POST', 'PUT', 'DELETE']
+        self.modifiable_methods = ['POST', 'PUT', 'PATCH', 'DELETE']
+
+        # per-request timings and byte counts
+        self.metrics = []
+
+        # failures in other threads are raised as nfvisError, see parallel()
+        self.main_thread = threading.current_thread()
+
+        # local cache of GET responses, see nfvisCache
+        self.cache = None
+        if self.params.get('cache_dir'):
+            try:
+                self.cache = nfvisCache(self.params['cache_dir'])
+            except (IOError, OSError) as e:
+                self.module.fail_json(msg='Unable to use cache_dir {0}: {1}'.format(self.params['cache_dir'], to_native(e)))
+
+        # The slots held by every thread, see _fetch()
+        self.slots = dict()
+        self.slots_lock = threading.Lock()
+
+        # cross-process cap on concurrent calls to the host, see nfvisHostSemaphore
+        self.semaphore = None
+        self.queue_wait = 0.0
+        if self.params.get('lock_dir'):
+            if not HAS_FCNTL:
+                self.module.fail_json(msg='lock_dir requires a platform with fcntl')
+            try:
+                self.semaphore = nfvisHostSemaphore(self.params['lock_dir'], self.host, self.params.get('max_host_requests') or 1)
+            except (IOError, OSError) as e:
+                self.module.fail_json(msg='Unable to use lock_dir {0}: {1}'.format(self.params['lock_dir'], to_native(e)))
+
+        # record/replay of API traffic, see nfvisCassette
+        self.cassette = None
+        if os.environ.get(NFVIS_CASSETTE_ENV):
+            try:
+                self.cassette = nfvisCassette(os.environ[NFVIS_CASSETTE_ENV],
+                                              os.environ.get(NFVIS_CASSETTE_MODE_ENV))
+            except ValueError as e:
+                self.module.fail_json(msg=to_native(e))
+
+    @property
+    def status(self):
+        """The status of the last request made by the calling thread, or by any thread if it made none."""
+        return getattr(self._local, 'status', self._status)
+
+    @status.setter
+    def status(self, value):
+        self._local.status = value
+        self._status = value
 
     def _fallback(self, value, fallback):
         if value is None:
             return fallback
         return value
 
-    def request(self, url_path, method='GET', payload=None, operation=None):
-        """Generic HTTP method for nfvis requests."""
+    def _fetch(self, url, method, payload, headers, metrics, **kwargs):
+        """Call fetch_url within the host's concurrency limit, retrying idempotent requests with backoff."""
+        limit = nfvis_concurrency_limit(self.host, self.params.get('max_concurrency') or 8)
+        retries = self.params.get('retries') or 0
+        if method not in NFVIS_IDEMPOTENT_METHODS:
+            retries = 0
+        metrics['retries'] = 0
+        metrics.setdefault('queue_wait', 0)
+        while True:
+            # A request made while this thread already holds a slot, e.g. while
+            # it iterates request_items(), runs within that slot instead of
+            # waiting for another one that may never come free
+            thread = threading.current_thread().ident
+            with self.slots_lock:
+                nested = self.slots.get(thread, 0) > 0
+                self.slots[thread] = self.slots.get(thread, 0) + 1
+            if not nested:
+                limit.acquire()
+            state = dict(healthy=False, slot=None, held=True)
+
+            # Released by the thread that reads the body, or by the garbage collector
+            def release(state=state, thread=thread, nested=nested):
+                with self.slots_lock:
+                    if not state['held']:
+                        return
+                    state['held'] = False
+                    self.slots[thread] -= 1
+                    if not self.slots[thread]:
+                        del self.slots[thread]
+                if nested:
+                    return
+                if state['slot'] is not None:
+                    self.semaphore.release(state['slot'])
+                limit.release(state['healthy'])
+
+            try:
+                if self.semaphore is not None and not nested:
+                    state['slot'], waited = self.semaphore.acquire()
+                    metrics['queue_wait'] = round(metrics['queue_wait'] + waited, 3)
+                    self.queue_wait += waited
+                resp, info = fetch_url(self.module, url,
+                                       headers=headers,
+                                       data=payload,
+                                       method=method,
+                                       timeout=self.params['timeout'],
+                                       **kwargs
+                                       )
+                state['healthy'] = info['status'] not in NFVIS_RETRY_STATUSES
+            except BaseException:
+                release()
+                raise
+            metrics['concurrency_limit'] = round(limit.limit, 2)
+            if state['healthy'] or metrics['retries'] >= retries:
+                if resp is None:
+                    release()
+                    return resp, info
+                # The body is read within the limit too, see _nfvisSlotReader
+                return _nfvisSlotReader(resp, release), info
+            if resp is not None:
+                resp.close()
+            release()
+            # Exponential backoff with full jitter
+            delay = min(self.params.get('retry_backoff', 1.0) * (2 ** metrics['retries']), NFVIS_RETRY_MAX_DELAY)
+            time.sleep(random.uniform(0, delay))
+            metrics['retries'] += 1
+
+    def _send(self, url_path, url, method, payload, headers):
+        """Send a request, going through the cassette when one is configured."""
+        metrics = dict(method=method, path=url_path)
+        self.metrics.append(metrics)
+        start = time.time()
+
+        if self.cassette is not None and self.cassette.mode == 'replay':
+            played = self.cassette.play(self.host, method, url_path, payload, url)
+            if played is None:
+                self.fail_json(msg='No cassette entry for {0} {1} in {2}'.format(method, url_path, self.cassette.path))
+            resp, info = played
+            if resp is not None:
+                resp = nfvisDecodedReader(resp, metrics=metrics)
+        else:
+            kwargs = dict()
+            if FETCH_URL_DECOMPRESS:
+                # Decompress here instead, so that the compressed size can be measured
+                kwargs['decompress'] = False
+            headers = dict(headers)
+            cache_key = None
+            if self.cache is not None and method == 'GET':
+                cache_key = self.cache.key(self.host, url_path, headers)
+                headers.update(self.cache.conditional_headers(cache_key))
+            resp, info = self._fetch(url, method, payload, headers, metrics, **kwargs)
+            encoding = info.get('content-encoding', '').lower()
+            if (info['status'] >= 300 or info['status'] < 0) and resp is not None:
+                resp.close()
+                resp = None
+            if resp is not None:
+                resp = nfvisDecodedReader(resp, encoding, metrics)
+            elif info.get('body') and encoding in ['gzip', 'deflate']:
+                info['body'] = nfvisDecodedReader(io.BytesIO(info['body']), encoding).read()
+
+            if cache_key is not None:
+                if info['status'] == 304:
+                    # The cached copy is still current, so serve it
+                    metrics['cache'] = 'hit'
+                    info.update(status=200, msg='OK (not modified)')
+                    resp = nfvisDecodedReader(self.cache.open(cache_key), metrics=metrics, wire=False)
+                elif resp is not None:
+                    metrics['cache'] = 'miss'
+                    resp = self.cache.store(cache_key, resp, info)
+
+            if self.cassette is not None:
+                resp, info = self.cassette.record(self.host, method, url_path, payload, resp, info)
 
+        metrics['status'] = info['status']
+        metrics['seconds'] = round(time.time() - start, 3)
+        return resp, info
 
+    def _open(self, url_path, method='GET', payload=None, operation=None, fail=True):
+        """Send a request and return the response body as a file-like object.
+
+        Only local state is used until the response is in, so requests can be
+        issued from several threads, see parallel().
+        """
         if operation in ['get_vlan', 'get_files']:
-            self.headers = {'Content-Type': 'application/vnd.yang.data+json',
-                            'Accept': 'application/vnd.yang.collection+json'}
+            headers = {'Content-Type': 'application/vnd.yang.data+json',
+                       'Accept': 'application/vnd.yang.collection+json'}
         else:
-            self.headers = {'Content-Type': 'application/vnd.yang.data+json',
-                            'Accept': 'application/vnd.yang.data+json'}
+            headers = {'Content-Type': 'application/vnd.yang.data+json',
+                       'Accept': 'application/vnd.yang.data+json'}
+        headers['Accept-Encoding'] = 'gzip, deflate'
+        url = 'https://{0}/api{1}'.format(self.host, url_path)
 
-        if method is not None:
-            self.method = method
-        self.url = 'https://{0}/api{1}'.format(self.host, url_path)
+        resp, info = self._send(url_path, url, method, payload, headers)
+        self.headers = headers
+        self.url = url
         self.method = method
         self.payload = payload
-
-        resp, info = fetch_url(self.module, self.url,
-                               headers=self.headers,
-                               data=payload,
-                               method=self.method,
-                               timeout=self.params['timeout'],
-                               )
         self.response = info['msg']
         self.status = info['status']
 
-        if self.status >= 300 or self.status < 0:
+        if info['status'] >= 300 or info['status'] < 0:
+            if not fail:
+                return None
             try:
                 self.fail_json(msg='Request failed for {url}: {status} - {msg}'.format(**info),
                                   body=json.loads(to_native(info['body'])))
+            except nfvisError:
+                raise
             except Exception:
                 pass
 
             self.fail_json(msg='Request failed for {url}: {status} - {msg}'.format(**info))
 
+        return resp
+
+    def request(self, url_path, method='GET', payload=None, operation=None, fail=True):
+        """Generic HTTP method for nfvis requests.
+
+        With fail=False an error status returns None instead of failing the module.
+        """
+        resp = self._open(url_path, method=method, payload=payload, operation=operation, fail=fail)
+        if resp is None:
+            return None
+
         try:
             return json.loads(to_native(resp.read()))
         except Exception:
             pass
-        
+        finally:
+            resp.close()
+
+    def request_items(self, url_path, item_path, operation=None):
+        """Stream the items of a list in a GET response, e.g. item_path='vmlc:deployments.deployment'.
+
+        Items are decoded one at a time, so only the item being processed is held in memory.
+        The response holds a concurrency slot until it is consumed or closed.
+        Requests made from the iterating thread meanwhile share that slot, but
+        do not wait on requests of other threads (e.g. parallel()) while
+        iterating, or they can wait for the slot forever.
+        """
+        resp = self._open(url_path, operation=operation)
+        try:
+            try:
+                for item in nfvisJSONStream(resp).items(item_path.split('.')):
+                    yield item
+            except ValueError as e:
+                self.fail_json(msg='Invalid JSON in response from {0}: {1}'.format(self.url, to_native(e)))
+            # Read the rest of the body so that it can be cached and recorded
+            while resp.read(65536):
+                pass
+        finally:
+            # Gives the concurrency slot back even if the items were not all consumed
+            resp.close()
+
+    def parallel(self, func, items, limit=None):
+        """Call func(item) for every item from up to limit worker threads.
+
+        Returns the results in the order of items, and a dict of the seconds
+        spent on each item by its index.  limit defaults to max_concurrency.
+        A failure in a worker stops the remaining items from being started and
+        fails the module once the running ones are done.
+        """
+        items = list(items)
+        return self.schedule(func, items, [()] * len(items), limit)
+
+    def schedule(self, func, items, dependencies, limit=None):
+        """Call func(item) for every item once the items it depends on are done, see parallel().
+
+        dependencies[i] holds the indexes of the items that items[i] waits for,
+        e.g. from nfvis_step_dependencies().  Every item is started as soon as
+        it is ready, in the order of items, so independent chains of work run
+        side by side.  Raises ValueError if the dependencies have a cycle.
+        """
+        items = list(items)
+        waiting = [set(indexes) for indexes in dependencies]
+        nfvis_topological_order(waiting)
+        results = [None] * len(items)
+        seconds = dict()
+        errors = []
+        pending = list(range(len(items)))
+        done = set()
+        condition = threading.Condition()
+
+        def worker():
+            while True:
+                with condition:
+                    while True:
+                        if errors or not pending:
+                            return
+                        ready = [index for index in pending if waiting[index] <= done]
+                        if ready:
+                            index = ready[0]
+                            pending.remove(index)
+                            break
+                        condition.wait()
+                start = time.time()
+                try:
+                    results[index] = func(items[index])
+                except nfvisError as e:
+                    errors.append(e)
+                except Exception as e:
+                    errors.append(nfvisError('{0}: {1}'.format(type(e).__name__, to_native(e))))
+                seconds[index] = round(time.time() - start, 3)
+                with condition:
+                    done.add(index)
+                    condition.notify_all()
+
+        limit = limit or self.params.get('max_concurrency') or 8
+        threads = [threading.Thread(target=worker) for i in range(min(limit, len(items)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.fail_json(msg=errors[0].msg, **errors[0].kwargs)
+        return results, seconds
+
+    def tenants(self):
+        """The names of the tenants of the host.  Hosts without the tenants list only have admin."""
+        section = nfvis_facts_section(self.request(NFVIS_TENANTS_PATH, fail=False), 'vmlc:tenants')
+        tenants = [tenant['name'] for tenant in nfvis_as_list(section.get('tenant') if isinstance(section, dict) else None)]
+        return tenants or ['admin']
+
+    def tenant_deployments(self, tenants=None):
+        """Fetch the deployments section of every tenant in parallel.
+
+        tenants defaults to all of the tenants of the host, see tenants().
+        Returns the sections keyed by tenant, in the order of the tenants, and
+        the seconds spent on each tenant.
+        """
+        if tenants is None:
+            tenants = self.tenants()
+
+        def get_deployments(tenant):
+            return nfvis_facts_section(self.request(NFVIS_TENANT_DEPLOYMENTS_PATH.format(tenant)), 'vmlc:deployments')
+
+        deployments, seconds = self.parallel(get_deployments, tenants)
+        return (OrderedDict(zip(tenants, deployments)),
+                OrderedDict((tenant, seconds.get(index)) for index, tenant in enumerate(tenants)))
+
+    def request_pages(self, url_path, item_path, page_size=100, operation=None):
+        """Stream the items of a collection one page of page_size items at a time.
+
+        Pages are requested with the offset and limit query parameters and
+        streamed with request_items(), so neither the whole collection nor a
+        whole page is held in memory.  The same restriction on requests made
+        while iterating applies.
+        """
+        separator = '&' if '?' in url_path else '?'
+        offset = 0
+        previous_first = None
+        while True:
+            count = 0
+            for item in self.request_items('{0}{1}offset={2}&limit={3}'.format(url_path, separator, offset, page_size),
+                                           item_path, operation=operation):
+                # A host that ignores offset returns the first page again
+                if count == 0 and offset and item == previous_first:
+                    return
+                if count == 0:
+                    previous_first = item
+                count += 1
+                yield item
+            # A short page is the last one, and a long one means the host does not page
+            if count != page_size:
+                return
+            offset += count
+
+    def events(self, stream, deadline):
+        """Subscribe to a notification stream and yield the data of every event until deadline.
+
+        None is yielded once the subscription is in place.  Raises IOError if
+        the stream is not available or breaks.  The connection is held for as
+        long as the caller waits, so it does not take a concurrency slot.
+        """
+        if self.cassette is not None and self.cassette.mode == 'replay':
+            raise IOError('Notification streams are not recorded')
+        url_path = NFVIS_EVENT_STREAM_PATH.format(stream)
+        metrics = dict(method='GET', path=url_path, events=0)
+        self.metrics.append(metrics)
+        start = time.time()
+        resp, info = fetch_url(self.module, 'https://{0}/api{1}'.format(self.host, url_path),
+                               headers={'Accept': 'text/event-stream'}, method='GET',
+                               timeout=max(1, deadline - time.time()))
+        metrics['status'] = info['status']
+        if info['status'] != 200 or resp is None:
+            metrics['seconds'] = round(time.time() - start, 3)
+            raise IOError('Notification stream {0} is not available: {1} - {2}'.format(stream, info['status'], info.get('msg')))
+        try:
+            yield None
+            data = []
+            while time.time() < deadline:
+                try:
+                    line = resp.readline()
+                except socket.timeout:
+                    return
+                if not line:
+                    raise IOError('Notification stream {0} was closed'.format(stream))
+                line = to_text(line).rstrip('\r\n')
+                if line.startswith('data:'):
+                    data.append(line[5:][1:] if line[5:6] == ' ' else line[5:])
+                elif not line and data:
+                    metrics['events'] += 1
+                    yield '\n'.join(data)
+                    data = []
+        finally:
+            resp.close()
+            metrics['seconds'] = round(time.time() - start, 3)
+
+    def wait_for_event(self, match, check, timeout, stream='NETCONF'):
+        """Wait up to timeout seconds for an event on a notification stream instead of polling.
+
+        match(data) tells whether the data of an event is the one waited for,
+        and check() whether the state it announces has already been reached.
+        check() is called once the subscription is in place, so an event sent
+        before that is not missed, and again when the time is up.  When the
+        stream is not available, or breaks, check() is polled with backoff for
+        the rest of the time instead.  Returns whether the event came and how
+        it was seen, 'stream' or 'poll'.
+        """
+        deadline = time.time() + timeout
+        try:
+            for data in self.events(stream, deadline):
+                if data is None:
+                    if check():
+                        return True, 'stream'
+                elif match(data):
+                    return True, 'stream'
+            return check(), 'stream'
+        except nfvisError:
+            raise
+        except Exception:
+            return self.poll(check, max(0, deadline - time.time())), 'poll'
+
+    def deployments_gone(self, tenant, names):
+        """Whether the operational state of a tenant lists none of the deployments in names.
+
+        The config of a deleted deployment is gone (404) as soon as the DELETE
+        commits, while NFVIS is still tearing its VMs down.  Only the
+        operational state tells when that is done, so poll this before reusing
+        the name or deleting the networks the deployment used.
+        """
+        response = self.request(NFVIS_TENANT_OPDATA_PATH.format(tenant), fail=False)
+        if response is None and self.status == 404:
+            return True
+        # Anything but a parsed list of deployments (an error, an empty or
+        # unparsable body) tells nothing, so keep polling
+        if not isinstance(response, dict) or 'vmlc:deployments' not in response:
+            return False
+        return not nfvis_opdata_deployment_names(response) & set(names)
+
+    def poll(self, check, timeout, interval=1, max_interval=15):
+        """Call check() with exponential backoff until it returns True or timeout seconds pass."""
+        deadline = time.time() + timeout
+        while True:
+            if check():
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+
+    def update(self, url_path, current, changes):
+        """Push a change set from nfvis_diff to the object at url_path.
+
+        Changed and added leaves are merged with a single PATCH, removed leaves
+        are deleted through their own sub-resource and replaced lists are PUT
+        through their parent container, so only the changed leaves are sent.
+        A list directly under the object root can only be replaced with a full
+        PUT of the object.  The bytes sent are compared against that full PUT
+        in result['payload_bytes'].
+        """
+        requests, full_payload = nfvis_update_requests(url_path, current, changes)
+        sent = sum(len(to_bytes(payload)) for method, path, payload in requests if payload is not None)
+        self.result['payload_bytes'] = dict(sent=sent, full=len(to_bytes(full_payload)),
+                                            saved=len(to_bytes(full_payload)) - sent)
+        if not self.module.check_mode:
+            for method, path, payload in requests:
+                self.request(path, method=method, payload=payload)
+        return requests
+
     def exit_json(self, **kwargs):
         """Custom written method to exit from module."""
         self.result['response'] = self.response
@@ -104,10 +2047,30 @@ class nfvisModule(object):
         self.result['method'] = self.method
 
         self.result.update(**kwargs)
+
+        # Trim the result to the requested level of detail
+        detail = self.params.get('result_detail', 'full')
+        if self.params.get('metrics'):
+            self.result['metrics'] = self.metrics
+        if self.semaphore is not None:
+            self.result['queue_wait'] = round(self.queue_wait, 3)
+        if detail != 'full':
+            for key in NFVIS_COLLECTION_RESULT_KEYS:
+                self.result.pop(key, None)
+            if detail == 'minimal':
+                for key in NFVIS_REQUEST_RESULT_KEYS:
+                    self.result.pop(key, None)
+            if self.result.get('payload') is not None:
+                summary = nfvis_summarize(self.result['payload'])
+                if detail == 'minimal' or summary['size'] > NFVIS_RESULT_MAX_PAYLOAD:
+                    self.result['payload'] = summary
+
         self.module.exit_json(**self.result)
 
     def fail_json(self, msg, **kwargs):
         """Custom written method to return info on failure."""
+        if threading.current_thread() is not self.main_thread:
+            raise nfvisError(msg, **kwargs)
         self.result['response'] = self.response
         self.result['status'] = self.status
         self.result['url'] = self.url
@@ -115,5 +2078,8 @@ class nfvisModule(object):
             self.result['payload'] = self.payload
         self.result['method'] = self.method
 
+        if self.params.get('metrics'):
+            self.result['metrics'] = self.metrics
+
         self.result.update(**kwargs)
         self.module.fail_json(msg=msg, **self.result)
\ No newline at end of file
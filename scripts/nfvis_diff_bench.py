@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the shared diff engine, nfvis_diff().
+
+Times the diff of a bridge with many ports (merged by name, as nfvis_bridge
+does) and of system settings with a long ip-receive-acl list (replaced).
+
+    nfvis_diff_bench.py --ports 5000 --acls 2000 --number 20
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'module_utils'))
+
+from nfvis import nfvis_diff, NFVIS_BRIDGE_MERGE_KEYS  # noqa: E402
+
+
+def bridge_case(ports):
+    """A bridge with ports on the host and half of them, plus one, requested."""
+    current = {'bridge': {'name': 'bench-br', 'port': [{'name': 'p{0}'.format(i)} for i in range(ports)], 'vlan': '10'}}
+    desired = {'bridge': {'port': [{'name': 'p{0}'.format(i)} for i in range(0, ports + 1, 2)], 'vlan': 10}}
+    return desired, current
+
+
+def settings_case(acls):
+    """System settings whose ip-receive-acl list is requested in the reverse order."""
+    acl = [{'source': '10.{0}.{1}.0/24'.format(i // 256, i % 256), 'action': 'accept', 'priority': 0,
+            'service': ['https', 'ssh']} for i in range(acls)]
+    mgmt = {'ip': {'address': '192.0.2.1', 'netmask': '255.255.255.0'}}
+    current = {'settings': {'hostname': 'bench', 'ip-receive-acls': {'ip-receive-acl': acl}, 'mgmt': mgmt}}
+    desired = {'settings': {'hostname': 'bench', 'ip-receive-acls': {'ip-receive-acl': list(reversed(acl))}, 'mgmt': mgmt}}
+    return desired, current
+
+
+def bench(func, number):
+    """The mean time of func in milliseconds."""
+    return timeit.timeit(func, number=number) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time nfvis_diff() on large bridges and settings.')
+    parser.add_argument('--ports', type=int, default=5000, help='Number of ports on the bridge')
+    parser.add_argument('--acls', type=int, default=2000, help='Number of ip-receive-acl entries')
+    parser.add_argument('--number', type=int, default=20, help='Number of runs to average')
+    args = parser.parse_args()
+
+    desired, current = bridge_case(args.ports)
+    print('bridge with {0} ports, merge diff: {1:8.2f} ms'.format(
+        args.ports, bench(lambda: nfvis_diff(desired, current, merge_keys=NFVIS_BRIDGE_MERGE_KEYS), args.number)))
+    desired, current = settings_case(args.acls)
+    print('settings with {0} ACL entries, diff: {1:8.2f} ms'.format(
+        args.acls, bench(lambda: nfvis_diff(desired, current), args.number)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
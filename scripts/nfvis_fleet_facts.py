@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Collect nfvis_facts from many NFVIS hosts in a single controller process.
+
+The hosts are queried concurrently with asyncio, each over one keep-alive
+HTTPS connection, using the same endpoints and parsing as the nfvis_facts
+module.  As with nfvis_facts, the admin deployments are returned in the
+deployments facts and those of the other tenants in tenant_deployments.
+Results are written as one JSON line per host as soon as the host
+is done.
+
+    nfvis_fleet_facts.py --hosts hosts.txt --output facts.jsonl --concurrency 200
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import ssl
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'module_utils'))
+
+from nfvis import (NFVIS_FACTS_SECTIONS, NFVIS_TENANTS_PATH, NFVIS_TENANT_DEPLOYMENTS_PATH,  # noqa: E402
+                   nfvis_as_list, nfvis_facts_section)
+
+
+def split_host(host, default_port=443):
+    """Split 'host', 'host:port' or '[v6-address]:port' into the address and the port."""
+    if host.startswith('['):
+        address, _, rest = host[1:].partition(']')
+        return address, int(rest[1:]) if rest.startswith(':') else default_port
+    if host.count(':') == 1:
+        address, port = host.split(':')
+        return address, int(port)
+    return host, default_port
+
+
+class NfvisHTTPError(IOError):
+    """A GET answered with an error status."""
+
+    def __init__(self, url_path, status):
+        super(NfvisHTTPError, self).__init__('GET {0} failed: {1}'.format(url_path, status))
+        self.status = status
+
+
+class NfvisConnection(object):
+    """Minimal HTTP/1.1 client for GETs against the NFVIS REST API over one connection."""
+
+    def __init__(self, host, user, password, ssl_context, timeout):
+        self.host = host
+        self.address, self.port = split_host(host)
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.auth = base64.b64encode('{0}:{1}'.format(user, password).encode('utf-8')).decode('ascii')
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.address, self.port, ssl=self.ssl_context), self.timeout)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+            self.writer = None
+
+    async def get(self, url_path):
+        """GET /api{url_path} and return the decoded JSON body.
+
+        GETs are idempotent, so a GET on a connection that the host closed or
+        reset, e.g. an idle keep-alive connection, is sent once more on a new
+        connection.
+        """
+        request = ('GET /api{0} HTTP/1.1\r\n'
+                   'Host: {1}\r\n'
+                   'Authorization: Basic {2}\r\n'
+                   'Accept: application/vnd.yang.data+json\r\n'
+                   'Accept-Encoding: gzip, deflate\r\n'
+                   'Connection: keep-alive\r\n\r\n').format(url_path, self.host, self.auth)
+        for attempt in range(2):
+            if self.writer is None:
+                await self._connect()
+            try:
+                self.writer.write(request.encode('ascii'))
+                await self.writer.drain()
+                status, headers, body = await asyncio.wait_for(self._read_response(), self.timeout)
+                break
+            except (ConnectionError, ssl.SSLEOFError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        if status >= 300:
+            raise NfvisHTTPError(url_path, status)
+
+        encoding = headers.get('content-encoding', '').lower()
+        if encoding == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                body = zlib.decompress(body, -zlib.MAX_WBITS)
+        if not body.strip():
+            return None
+        return json.loads(body.decode('utf-8'))
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionAbortedError('Connection closed by {0}'.format(self.host))
+        status = int(status_line.split()[1])
+        headers = dict()
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # Skip the trailers
+                    while (await self.reader.readline()).strip():
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        elif status in (204, 304):
+            body = b''
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        return status, headers, body
+
+
+async def collect_host(host, args, ssl_context):
+    """Gather the facts sections and the deployments of every tenant of one host."""
+    start = time.time()
+    connection = NfvisConnection(host, args.user, args.password, ssl_context, args.timeout)
+    result = dict(host=host)
+    try:
+        # Hosts without the tenants list only have admin
+        try:
+            section = nfvis_facts_section(await connection.get(NFVIS_TENANTS_PATH), 'vmlc:tenants')
+        except NfvisHTTPError:
+            section = None
+        tenants = [tenant['name'] for tenant in nfvis_as_list(section.get('tenant') if isinstance(section, dict) else None)]
+        tenant_deployments = dict()
+        for tenant in tenants or ['admin']:
+            tenant_deployments[tenant] = nfvis_facts_section(
+                await connection.get(NFVIS_TENANT_DEPLOYMENTS_PATH.format(tenant)), 'vmlc:deployments')
+
+        # The admin deployments are kept as deployments, like nfvis_facts does
+        facts = dict()
+        for name, url_path, key in NFVIS_FACTS_SECTIONS:
+            if name == 'deployments' and 'admin' in tenant_deployments:
+                facts[name] = tenant_deployments.pop('admin')
+                continue
+            facts[name] = nfvis_facts_section(await connection.get(url_path), key)
+        result['facts'] = facts
+        result['tenants'] = tenants or ['admin']
+        result['tenant_deployments'] = tenant_deployments
+    except Exception as e:
+        result.update(failed=True, msg='{0}: {1}'.format(type(e).__name__, e))
+    finally:
+        await connection.close()
+    result['seconds'] = round(time.time() - start, 3)
+    return result
+
+
+async def collect(hosts, args, output):
+    ssl_context = ssl.create_default_context()
+    if not args.validate_certs:
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failed = 0
+
+    async def bounded(host):
+        async with semaphore:
+            return await collect_host(host, args, ssl_context)
+
+    for task in asyncio.as_completed([bounded(host) for host in hosts]):
+        result = await task
+        failed += bool(result.get('failed'))
+        output.write(json.dumps(result, separators=(',', ':')) + '\n')
+        output.flush()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect nfvis_facts from many NFVIS hosts.')
+    parser.add_argument('--hosts', required=True, help="File with one NFVIS host per line ('-' for stdin)")
+    parser.add_argument('--user', default=os.environ.get('NFVIS_USER'), help='Username (default: $NFVIS_USER)')
+    parser.add_argument('--password', default=os.environ.get('NFVIS_PASSWORD'),
+                        help='Password (default: $NFVIS_PASSWORD)')
+    parser.add_argument('--output', default='-', help="JSON Lines output file ('-' for stdout)")
+    parser.add_argument('--concurrency', type=int, default=200, help='Maximum number of hosts queried at once')
+    parser.add_argument('--timeout', type=float, default=60, help='Timeout of every network operation in seconds')
+    parser.add_argument('--validate-certs', action='store_true', help='Validate the certificates of the hosts')
+    args = parser.parse_args()
+    if not args.user or not args.password:
+        parser.error('--user and --password (or NFVIS_USER and NFVIS_PASSWORD) are required')
+
+    source = sys.stdin if args.hosts == '-' else open(args.hosts)
+    with source:
+        hosts = [line.strip() for line in source if line.strip() and not line.startswith('#')]
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        failed = asyncio.run(collect(hosts, args, output))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The shared code is imported as a plain module, the way the scripts do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'module_utils'))
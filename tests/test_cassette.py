@@ -0,0 +1,29 @@
+import io
+
+from nfvis import nfvisCassette
+
+
+def test_record_then_replay_in_order(tmp_path):
+    path = str(tmp_path / 'site.jsonl.gz')
+    cassette = nfvisCassette(path, 'record')
+    for body in [b'{"n": 1}', b'{"n": 2}']:
+        resp, info = cassette.record('h1', 'GET', '/config/networks', None, io.BytesIO(body), dict(status=200, msg='OK'))
+        assert resp.read() == body
+    cassette.record('h1', 'POST', '/config/networks', '{"network": {}}', None, dict(status=409, msg='Conflict', body=b'exists'))
+
+    cassette = nfvisCassette(path)
+    assert cassette.mode == 'replay'
+    bodies = [cassette.play('h1', 'GET', '/config/networks', None, 'url')[0].read() for i in range(3)]
+    # The last response is repeated once the recorded ones run out
+    assert bodies == [b'{"n": 1}', b'{"n": 2}', b'{"n": 2}']
+    resp, info = cassette.play('h1', 'POST', '/config/networks', '{"network": {}}', 'url')
+    assert resp is None and info['status'] == 409 and info['body'] == b'exists'
+
+
+def test_replay_matches_on_host_and_payload(tmp_path):
+    path = str(tmp_path / 'site.jsonl')
+    nfvisCassette(path, 'record').record('h1', 'PUT', '/config/x', '{"a": 1}', io.BytesIO(b''), dict(status=204, msg='OK'))
+    cassette = nfvisCassette(path, 'replay')
+    assert cassette.play('h1', 'PUT', '/config/x', '{"a": 2}', 'url') is None
+    assert cassette.play('h2', 'PUT', '/config/x', '{"a": 1}', 'url') is None
+    assert cassette.play('h1', 'PUT', '/config/x', '{"a": 1}', 'url')[1]['status'] == 204
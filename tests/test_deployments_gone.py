@@ -0,0 +1,34 @@
+import pytest
+
+import nfvis
+from nfvis import nfvisModule, nfvisError
+
+
+class FakeModule(object):
+    def __init__(self):
+        self.params = dict(host='h1', user='u', password='p', retries=0)
+
+    def fail_json(self, **kwargs):
+        raise nfvisError(**kwargs)
+
+
+@pytest.mark.parametrize('status, response, gone', [
+    (404, None, True),
+    (200, {'vmlc:deployments': {}}, True),
+    (200, {'vmlc:deployments': {'deployment': [{'deployment_name': 'other'}]}}, True),
+    (200, {'vmlc:deployments': {'deployment': {'deployment_name': 'vm1'}}}, False),
+    # An empty or unparsable body, or an error, is not proof that the VMs are gone
+    (200, None, False),
+    (200, {'unexpected': 1}, False),
+    (503, None, False),
+])
+def test_deployments_gone(monkeypatch, status, response, gone):
+    module = nfvisModule(FakeModule())
+
+    def request(url_path, fail=True):
+        assert url_path == nfvis.NFVIS_TENANT_OPDATA_PATH.format('t1')
+        module.status = status
+        return response
+
+    monkeypatch.setattr(module, 'request', request)
+    assert module.deployments_gone('t1', ['vm1']) is gone
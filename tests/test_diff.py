@@ -0,0 +1,52 @@
+import json
+
+from nfvis import nfvis_diff, nfvis_apply_changes, nfvis_update_requests, NFVIS_ABSENT, NFVIS_BRIDGE_MERGE_KEYS
+
+
+def test_equal_after_normalization_is_no_change():
+    current = {'bridge': {'name': 'br', 'vlan': '100', 'port': {'name': 'eth0'}}}
+    desired = {'bridge': {'vlan': 100, 'port': [{'name': 'eth0'}], 'dhcp': None}}
+    assert nfvis_diff(desired, current) == []
+
+
+def test_add_replace_and_remove():
+    current = {'settings': {'hostname': 'old', 'dpdk': 'enable'}}
+    desired = {'settings': {'hostname': 'new', 'dpdk': NFVIS_ABSENT, 'default-gw': '10.0.0.1'}}
+    changes = sorted(nfvis_diff(desired, current), key=lambda change: change['path'])
+    assert changes == [
+        dict(op='add', path=['settings', 'default-gw'], new='10.0.0.1'),
+        dict(op='remove', path=['settings', 'dpdk'], old='enable'),
+        dict(op='replace', path=['settings', 'hostname'], old='old', new='new'),
+    ]
+
+
+def test_merge_keys_only_add_missing_entries():
+    current = {'bridge': {'port': [{'name': 'eth0'}, {'name': 'eth1'}]}}
+    desired = {'bridge': {'port': [{'name': 'eth1'}, {'name': 'eth2'}]}}
+    changes = nfvis_diff(desired, current, merge_keys=NFVIS_BRIDGE_MERGE_KEYS)
+    assert changes == [dict(op='merge', path=['bridge', 'port'], old=current['bridge']['port'], new=[{'name': 'eth2'}])]
+    merged = nfvis_apply_changes(current, changes)
+    assert [port['name'] for port in merged['bridge']['port']] == ['eth0', 'eth1', 'eth2']
+    # The current object is left alone
+    assert len(current['bridge']['port']) == 2
+
+
+def test_update_requests_patch_delete_and_put():
+    current = {'settings': {'hostname': 'old', 'dpdk': 'enable', 'ip-receive-acls': {'ip-receive-acl': [{'source': 'a'}]}}}
+    desired = {'settings': {'hostname': 'new', 'dpdk': NFVIS_ABSENT,
+                            'ip-receive-acls': {'ip-receive-acl': [{'source': 'b'}, {'source': 'c'}]}}}
+    requests, full = nfvis_update_requests('/config/system/settings', current, nfvis_diff(desired, current))
+    methods = dict((method, (path, payload)) for method, path, payload in requests)
+    assert requests[0][0] == 'PATCH'
+    assert json.loads(methods['PATCH'][1]) == {'settings': {'hostname': 'new'}}
+    assert methods['DELETE'] == ('/config/system/settings/dpdk', None)
+    assert methods['PUT'][0] == '/config/system/settings/ip-receive-acls'
+    assert json.loads(methods['PUT'][1]) == {'ip-receive-acls': {'ip-receive-acl': [{'source': 'b'}, {'source': 'c'}]}}
+    assert json.loads(full)['settings']['hostname'] == 'new'
+
+
+def test_update_requests_fall_back_to_full_put_for_root_lists():
+    current = {'bridge': {'name': 'br', 'port': [{'name': 'eth0'}, {'name': 'eth1'}]}}
+    desired = {'bridge': {'port': [{'name': 'eth2'}, {'name': 'eth3'}]}}
+    requests, full = nfvis_update_requests('/config/bridges/bridge/br', current, nfvis_diff(desired, current))
+    assert requests == [('PUT', '/config/bridges/bridge/br', full)]
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from nfvis import nfvis_job_id, nfvis_job_status, nfvis_job_cleanup
+
+
+@pytest.mark.parametrize('job, expected', [
+    ('j937044290214.24526', 'j937044290214.24526'),
+    ('937044290214.24526', '937044290214.24526'),
+    (dict(ansible_job_id='j1.2', started=1), 'j1.2'),
+    (dict(skipped=True), None),
+    ('', None),
+    (None, None),
+])
+def test_job_id(job, expected):
+    assert nfvis_job_id(job) == expected
+
+
+@pytest.mark.parametrize('job', ['../../etc/passwd', '/etc/passwd', 'j1.2/../x', 'j1', 'x1.2', 'j1.2 ',
+                                 dict(ansible_job_id='../j1.2')])
+def test_job_id_rejects_paths(job):
+    with pytest.raises(ValueError):
+        nfvis_job_id(job)
+
+
+def test_job_status_and_cleanup_reject_paths(tmp_path):
+    victim = tmp_path / 'victim'
+    victim.write_text('keep')
+    async_dir = str(tmp_path / 'async')
+    os.mkdir(async_dir)
+    with pytest.raises(ValueError):
+        nfvis_job_cleanup(async_dir, '../victim')
+    with pytest.raises(ValueError):
+        nfvis_job_status(async_dir, '../victim')
+    assert victim.exists()
+
+
+def test_job_status_and_cleanup(tmp_path):
+    (tmp_path / 'j1.2').write_text('{"changed": true}')
+    assert nfvis_job_status(str(tmp_path), 'j1.2')['state'] == 'finished'
+    nfvis_job_cleanup(str(tmp_path), 'j1.2')
+    assert nfvis_job_status(str(tmp_path), 'j1.2')['state'] == 'unknown'
@@ -0,0 +1,35 @@
+import io
+import json
+
+import pytest
+
+from nfvis import nfvisJSONStream
+
+DOCUMENT = {'vmlc:deployments': {'other': [1, {'deployment': 'not this one'}],
+                                 'deployment': [{'name': 'd{0}'.format(i), 'size': i * 1.5, 'note': u'café ✓',
+                                                 'config': 'x' * (i * 7)} for i in range(20)]}}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 65536])
+def test_items_across_chunk_boundaries(chunk_size):
+    data = json.dumps(DOCUMENT).encode('utf-8')
+    stream = nfvisJSONStream(io.BytesIO(data), chunk_size=chunk_size)
+    assert list(stream.items(['vmlc:deployments', 'deployment'])) == DOCUMENT['vmlc:deployments']['deployment']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5])
+def test_numbers_split_between_chunks(chunk_size):
+    data = b'{"c": [12345, -0.5e10, 7, 123456789]}'
+    assert list(nfvisJSONStream(io.BytesIO(data), chunk_size=chunk_size).items(['c'])) == [12345, -0.5e10, 7, 123456789]
+
+
+def test_single_object_empty_list_and_missing_key():
+    assert list(nfvisJSONStream(io.BytesIO(b'{"c": {"name": "a"}}'), 2).items(['c'])) == [{'name': 'a'}]
+    assert list(nfvisJSONStream(io.BytesIO(b'{"c": [ ]}'), 2).items(['c'])) == []
+    assert list(nfvisJSONStream(io.BytesIO(b'{"d": [1]}'), 2).items(['c'])) == []
+    assert list(nfvisJSONStream(io.BytesIO(b''), 2).items(['c'])) == []
+
+
+def test_truncated_document_raises():
+    with pytest.raises(ValueError):
+        list(nfvisJSONStream(io.BytesIO(b'{"c": [{"name": "a"}, {"na'), 4).items(['c']))
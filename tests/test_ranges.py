@@ -0,0 +1,33 @@
+import pytest
+
+from nfvis import (nfvis_ranges, nfvis_ranges_from_ids, nfvis_ranges_subtract, nfvis_ranges_intersect,
+                   nfvis_ranges_ids, nfvis_ranges_format)
+
+
+def test_parse_and_compact():
+    assert nfvis_ranges('100-199,300, 200') == [[100, 200], [300, 300]]
+    assert nfvis_ranges([300, '10-12', '11-20']) == [[10, 20], [300, 300]]
+    assert nfvis_ranges(None) == []
+    assert nfvis_ranges_from_ids([5, 3, 4, 9, 1]) == [[1, 1], [3, 5], [9, 9]]
+
+
+@pytest.mark.parametrize('value', ['0', '4095', '20-10', 'abc', '1-x'])
+def test_invalid_ranges(value):
+    with pytest.raises(ValueError):
+        nfvis_ranges(value)
+
+
+def test_subtract_and_intersect():
+    a = nfvis_ranges('1-10,20-30')
+    b = nfvis_ranges('5-6,9-21,30')
+    assert nfvis_ranges_subtract(a, b) == [[1, 4], [7, 8], [22, 29]]
+    assert nfvis_ranges_intersect(a, b) == [[5, 6], [9, 10], [20, 21], [30, 30]]
+    assert nfvis_ranges_subtract(a, []) == a
+    assert nfvis_ranges_intersect(a, []) == []
+
+
+def test_ids_and_format_round_trip():
+    intervals = nfvis_ranges('1,3-5,7')
+    assert list(nfvis_ranges_ids(intervals)) == [1, 3, 4, 5, 7]
+    assert nfvis_ranges_format(intervals) == '1,3-5,7'
+    assert nfvis_ranges(nfvis_ranges_format(intervals)) == intervals
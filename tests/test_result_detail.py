@@ -0,0 +1,46 @@
+import pytest
+
+from nfvis import nfvisModule
+
+
+class FakeModule(object):
+    def __init__(self, **params):
+        self.params = dict(host='h1', user='u', password='p', result_detail='full', metrics=False)
+        self.params.update(params)
+        self.exited = None
+
+    def exit_json(self, **kwargs):
+        self.exited = kwargs
+
+    def fail_json(self, **kwargs):
+        self.exited = kwargs
+
+
+def exit_result(**params):
+    module = FakeModule(**params)
+    nfvis = nfvisModule(module)
+    nfvis.metrics.append(dict(method='GET', path='/config/networks', status=200))
+    nfvis.result['current'] = {'network:networks': {'network': [{'name': 'n{0}'.format(i)} for i in range(100)]}}
+    nfvis.payload = 'x' * 4096
+    nfvis.exit_json(changed=True)
+    return module.exited
+
+
+def test_metrics_only_when_asked_for():
+    assert 'metrics' not in exit_result()
+    assert exit_result(metrics=True)['metrics'] == [dict(method='GET', path='/config/networks', status=200)]
+    assert 'metrics' in exit_result(metrics=True, result_detail='minimal')
+
+
+@pytest.mark.parametrize('detail', ['changes', 'minimal'])
+def test_large_payloads_and_collections_are_trimmed(detail):
+    result = exit_result(result_detail=detail)
+    assert 'current' not in result
+    assert result['payload']['size'] == 4096 and 'sha1' in result['payload']
+    assert result['changed']
+
+
+def test_full_keeps_everything_but_metrics():
+    result = exit_result()
+    assert result['payload'] == 'x' * 4096
+    assert len(result['current']['network:networks']['network']) == 100
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from nfvis import nfvisModule, nfvisError, nfvis_topological_order, nfvis_step_dependencies
+
+
+class FakeModule(object):
+    def __init__(self):
+        self.params = dict(host='h1', user='u', password='p', max_concurrency=8)
+
+    def fail_json(self, **kwargs):
+        raise nfvisError(**kwargs)
+
+
+def step(kind, name, action, uses=None):
+    return dict(kind=kind, name=name, action=action, uses=uses or [])
+
+
+def test_topological_order():
+    dependencies = [{1, 2}, {2}, set(), {0}]
+    order = nfvis_topological_order(dependencies)
+    assert sorted(order) == [0, 1, 2, 3]
+    for index, before in enumerate(dependencies):
+        assert all(order.index(other) < order.index(index) for other in before)
+
+
+def test_topological_order_cycle():
+    with pytest.raises(ValueError):
+        nfvis_topological_order([{1}, {2}, {0}])
+
+
+def test_step_dependencies_build_and_teardown():
+    steps = [step('deployment', 'vm', 'delete', [('network', 'old-net')]),
+             step('network', 'old-net', 'delete', [('bridge', 'old-br')]),
+             step('bridge', 'old-br', 'delete'),
+             step('bridge', 'br', 'create'),
+             step('network', 'net', 'create', [('bridge', 'br')]),
+             step('deployment', 'vm2', 'create', [('network', 'net')])]
+    dependencies = nfvis_step_dependencies(steps)
+    # Teardown follows uses in reverse
+    assert 0 in dependencies[1] and 1 in dependencies[2]
+    # Building follows uses, after the deletes of the same kind
+    assert dependencies[3] == {2}
+    assert dependencies[4] == {3, 1}
+    assert dependencies[5] == {4, 0}
+
+
+def test_schedule_runs_after_dependencies():
+    nfvis = nfvisModule(FakeModule())
+    finished = []
+    lock = threading.Lock()
+
+    def work(item):
+        time.sleep(0.05 if item == 'slow' else 0)
+        with lock:
+            finished.append(item)
+        return item.upper()
+
+    items = ['slow', 'after-slow', 'free', 'after-both']
+    results, seconds = nfvis.schedule(work, items, [set(), {0}, set(), {1, 2}])
+    assert results == ['SLOW', 'AFTER-SLOW', 'FREE', 'AFTER-BOTH']
+    assert finished.index('free') < finished.index('slow')
+    assert finished.index('slow') < finished.index('after-slow') < finished.index('after-both')
+    assert sorted(seconds) == [0, 1, 2, 3]
+
+
+def test_schedule_reports_the_first_failure():
+    nfvis = nfvisModule(FakeModule())
+
+    def work(item):
+        if item == 'bad':
+            raise ValueError('boom')
+
+    with pytest.raises(nfvisError) as e:
+        nfvis.schedule(work, ['bad', 'after'], [set(), {0}])
+    assert 'boom' in e.value.msg
+
+
+def test_step_dependencies_delete_waits_for_moves():
+    # n1 moves from old-br, which is deleted, to new-br; vm moves from
+    # old-net, which is deleted, to n1
+    steps = [step('network', 'old-net', 'delete', [('bridge', 'old-br')]),
+             step('bridge', 'old-br', 'delete'),
+             step('bridge', 'new-br', 'create'),
+             dict(step('network', 'n1', 'update', [('bridge', 'new-br')]), used=[('bridge', 'old-br')]),
+             dict(step('deployment', 'vm', 'update', [('network', 'n1')]), used=[('network', 'old-net')])]
+    dependencies = nfvis_step_dependencies(steps)
+    order = nfvis_topological_order(dependencies)
+    # POST new-br, PATCH n1 and only then DELETE old-br
+    assert order.index(2) < order.index(3) < order.index(1)
+    assert 3 in dependencies[1]
+    # The network vm leaves is deleted once vm moved
+    assert 4 in dependencies[0]
+    assert order.index(4) < order.index(0) < order.index(1)
+    # The deletes of their kind that wait for them are not waited for
+    assert 1 not in dependencies[2]
+    assert 0 not in dependencies[3]
@@ -0,0 +1,78 @@
+import io
+import json
+import threading
+
+import nfvis
+from nfvis import nfvisModule, nfvisError
+
+
+class FakeModule(object):
+    def __init__(self, **params):
+        self.params = dict(host='slots-test', user='u', password='p', validate_certs=False, timeout=10, retries=0,
+                           max_concurrency=1, max_host_requests=1)
+        self.params.update(params)
+
+    def fail_json(self, **kwargs):
+        raise nfvisError(**kwargs)
+
+    def warn(self, msg):
+        pass
+
+
+def fake_fetch_url(module, url, **kwargs):
+    if url.endswith('/big'):
+        body = {'c': {'item': [{'name': 'i{0}'.format(i), 'pad': 'x' * 1000} for i in range(200)]}}
+    else:
+        body = {'ok': True}
+    return io.BytesIO(json.dumps(body).encode('utf-8')), dict(status=200, msg='OK', url=url)
+
+
+def run_with_timeout(func, timeout=10):
+    result = dict()
+
+    def target():
+        result['value'] = func()
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'deadlocked'
+    return result['value']
+
+
+def test_nested_requests_share_the_slot(monkeypatch, tmp_path):
+    monkeypatch.setattr(nfvis, 'fetch_url', fake_fetch_url)
+    module = nfvisModule(FakeModule(lock_dir=str(tmp_path)))
+
+    def iterate():
+        names = []
+        for item in module.request_items('/big', 'c.item'):
+            if len(names) < 3:
+                assert module.request('/small') == {'ok': True}
+            names.append(item['name'])
+        return names
+
+    assert len(run_with_timeout(iterate)) == 200
+    # Every slot was given back, so an unrelated request still goes through
+    assert module.slots == dict()
+    assert nfvis.nfvis_concurrency_limit('slots-test', 1).active == 0
+    assert run_with_timeout(lambda: module.request('/small')) == {'ok': True}
+
+
+def test_slot_is_held_while_the_body_is_read(monkeypatch, tmp_path):
+    monkeypatch.setattr(nfvis, 'fetch_url', fake_fetch_url)
+    module = nfvisModule(FakeModule(host='slots-test-2', lock_dir=str(tmp_path)))
+    items = module.request_items('/big', 'c.item')
+    next(items)
+    assert sum(module.slots.values()) == 1
+    # Another thread has to wait for it
+    other = threading.Thread(target=lambda: module.request('/small'))
+    other.daemon = True
+    other.start()
+    other.join(0.3)
+    assert other.is_alive()
+    items.close()
+    other.join(10)
+    assert not other.is_alive()
+    assert module.slots == dict()